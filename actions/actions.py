@@ -1,16 +1,11 @@
-import glob
+import asyncio
 import logging
 import os
-import re
-import tempfile
-from datetime import timedelta, datetime
-from pathlib import Path
-from typing import Any, Text, Dict, List, Optional, Tuple, Iterable
+import threading
+from datetime import datetime
+from typing import Any, Text, Dict, List, Optional
 
-import dateparser
 import pandas as pd
-import seaborn as sns
-from matplotlib import pyplot as plt
 from rasa_sdk import Action, FormValidationAction
 from rasa_sdk.events import UserUtteranceReverted, FollowupAction, ActiveLoop
 from rasa_sdk.interfaces import Tracker
@@ -18,85 +13,47 @@ from rasa_sdk.executor import CollectingDispatcher
 from rasa_sdk.events import SlotSet
 from rasa_sdk.types import DomainDict
 
-from text2digits import text2digits
-
-T2D = text2digits.Text2Digits()
+from actions.aggregation import aggregate_prices, aggregate_rollup, bucket_frequency
+from actions.cache import ResultCache
+from actions.charts import store_from_env
+from actions.dates import DATE_FORMAT, parse_date, resolve_period
+from actions.registry import registry_from_env
+from actions.rendering import render
 
 logger = logging.getLogger(__name__)
 
-# this will load the latest version of the datasets
-load_from_hdx = os.getenv('UPDATE_HDX_DATASETS', 'False').lower() in ['true', '1', 'yes']
-if load_from_hdx:
+# set for the whole action server, frames derived from one another never write through to their source
+pd.set_option('mode.copy_on_write', True)
+
+# datasets are loaded lazily on the first request for a country
+DATASETS = registry_from_env()
+
+# rendered charts, shared with the streamlit application
+CHARTS = store_from_env()
+
+# filtered data and charts of recent analyses
+RESULTS = ResultCache(max_bytes=int(float(os.getenv('ANALYSIS_CACHE_MB', 128)) * 1024 * 1024))
+
+
+def update_in_background():
     from datasets.update import update_datasets
 
     update_datasets()
+    DATASETS.refresh()
+    logger.info(f'Updated datasets for the following countries: {", ".join(DATASETS.countries)}')
+
 
-COUNTRIES_DATASETS = {
-    Path(path).stem: pd.read_csv(path)
-    for path in glob.glob('datasets/data/*.csv')
-}
+# this will load the latest version of the datasets without blocking the server
+load_from_hdx = os.getenv('UPDATE_HDX_DATASETS', 'False').lower() in ['true', '1', 'yes']
+if load_from_hdx:
+    threading.Thread(target=update_in_background, name='update-datasets', daemon=True).start()
 
-logger.info(f'Loaded datasets for the following countries: {", ".join(sorted(COUNTRIES_DATASETS.keys()))}')
+logger.info(f'Found datasets for the following countries: {", ".join(DATASETS.countries)}')
 
-ALL_COMMODITIES = set()
-for d in COUNTRIES_DATASETS.values():
-    ALL_COMMODITIES.update(d.commodity.unique())
+ALL_COMMODITIES = DATASETS.all_commodities
 
 logger.info(f'The following commodities are supported: {", ".join(sorted(ALL_COMMODITIES))}')
 
-DATE_FORMAT = '%Y-%m-%d'
-REGEX_RELATIVE_DATE = re.compile(r'(recent|latest|last|past|previous|current)'
-                                 r'(\s+(.*))?'  # [2] capture group is number days/weeks etc.
-                                 r'\s+(year|month|quarter|week|day|decade)(s)?')  # [3] capture group will is a period
-
-PERIOD2LENGTH = {
-    'year': 365,
-    'month': 30,
-    'quarter': 91,
-    'week': 7,
-    'day': 1,
-    'decade': 3650
-}
-
-NATURAL2INT = {
-    'couple': 2,
-    'few': 3,
-    'several': 4,
-    'dozen': 12,
-    'half-dozen': 6,
-}
-
-
-def match_score(d1: str, d2: str) -> float:
-    def strip_chars(s: str) -> str:
-        return (s.strip().lower()
-                .replace(' ', '')
-                .replace('(', '')
-                .replace(')', '')
-                .replace('-', ''))
-
-    d1 = strip_chars(d1)
-    d2 = strip_chars(d2)
-    end = 0
-    for end in reversed(range(len(d1) + 1)):
-        substr = d1[:end]
-        if substr in d2:
-            break
-
-    return (1 - (len(d1) - end) / len(d1)) * (len(d1) / len(d2))
-
-
-def select_best_match(target: str, candidates: Iterable[str]) -> Tuple[Optional[str], float]:
-    best_match = 0.0
-    best_matched_candidate = None
-
-    for candidate in candidates:
-        curr_match = match_score(target, candidate)
-        if curr_match > best_match:
-            best_match = curr_match
-            best_matched_candidate = candidate
-
-    return best_matched_candidate, best_match
 
 
 class ActionShowTable(Action):
@@ -113,40 +70,32 @@ class ActionShowTable(Action):
         start_date = tracker.get_slot('start_date') or '1900-01-01'
         end_date = tracker.get_slot('end_date') or '2100-12-31'
 
-        start_date, end_date = dateparser.parse(start_date), dateparser.parse(end_date)
+        start_date, end_date = parse_date(start_date), parse_date(end_date)
 
-        relevant_datasets = []
-        commodities_for_analysis = set()
+        # (country, commodity) pairs to look up
+        pairs = []
 
         # if no countries are selected, choose all possible countries
         skip_match = False
         if not len(countries):
-            countries = list(COUNTRIES_DATASETS.keys())
+            countries = DATASETS.countries
             skip_match = True
 
         for country in countries:
             if not skip_match:
-                best_match, score = select_best_match(
-                    country.lower().strip().replace(' ', ''),
-                    COUNTRIES_DATASETS.keys()
-                )
+                best_match, score = DATASETS.country_matcher.best(country.lower().strip().replace(' ', ''))
                 if score < 0.2:
                     dispatcher.utter_message(text=f'The country {country} is not supported yet. Sorry!')
                     return []
 
                 country = best_match
 
-            dataset = COUNTRIES_DATASETS[country]
-
-            dataset['date'] = pd.to_datetime(dataset['date'])
-            possible_commodities = dataset.commodity.unique()
+            possible_commodities = DATASETS.commodities(country)
+            commodity_matcher = DATASETS.commodity_matcher(country)
 
-            target_commodities = [] if len(commodities) else possible_commodities
+            target_commodities = [] if len(commodities) else list(possible_commodities)
             for commodity in commodities:
-                best_commodity, score = select_best_match(
-                    commodity.lower().strip().replace(' ', ''),
-                    possible_commodities
-                )
+                best_commodity, score = commodity_matcher.best(commodity.lower().strip().replace(' ', ''))
 
                 if best_commodity is not None and (score > 0.2 or commodity.lower() in best_commodity.lower()):
                     target_commodities.append(best_commodity)
@@ -156,18 +105,12 @@ class ActionShowTable(Action):
                     if commodity.lower()[:-1] in possible_commodity.lower():
                         target_commodities.append(possible_commodity)
 
-            commodities_for_analysis.update(target_commodities)
-
-            dataset_filtered = dataset[(dataset['commodity'].isin(target_commodities)) &
-                                       (dataset['date'] >= start_date) &
-                                       (dataset['date'] <= end_date)].reset_index()
+            pairs.extend((country, commodity) for commodity in target_commodities)
 
-            dataset_filtered['country'] = country
-            relevant_datasets.append(dataset_filtered)
+        # (country, commodity) -> (first date, last date) within the requested period
+        coverage = DATASETS.spans(pairs, start_date, end_date)
 
-        filtered_df = pd.concat(relevant_datasets, ignore_index=True)
-
-        if not len(filtered_df):
+        if not len(coverage):
             dispatcher.utter_message(text=f'No data found for the period from {start_date.strftime("%Y-%m-%d")} '
                                           f'to {end_date.strftime("%Y-%m-%d")}')
             return []
@@ -178,10 +121,9 @@ class ActionShowTable(Action):
             "data": []
         }
 
-        grouped = filtered_df.groupby(['country', 'commodity'])
-        for (country, commodity), group in grouped:
-            start_date = group['date'].min().strftime('%Y-%m-%d')
-            end_date = group['date'].max().strftime('%Y-%m-%d')
+        for (country, commodity), (first_date, last_date) in sorted(coverage.items()):
+            start_date = first_date.strftime('%Y-%m-%d')
+            end_date = last_date.strftime('%Y-%m-%d')
             table_data['data'].append([country, commodity, start_date, end_date])
 
         # Send the table data as a custom message
@@ -200,63 +142,6 @@ class MapEntitiesToSlotsAction(Action):
 
         # Create a list of SlotSet events
         events = [SlotSet('image_paths', [])]
-        first_settings = {
-            'PREFER_DAY_OF_MONTH': 'first',
-            'PREFER_MONTH_OF_YEAR': 'first'
-        }
-        last_settings = {
-            'PREFER_DAY_OF_MONTH': 'last',
-            'PREFER_MONTH_OF_YEAR': 'last'
-        }
-
-        def parse_date(relative_date_str):
-            today = datetime.today()
-
-            # assume relative date
-            match = REGEX_RELATIVE_DATE.findall(relative_date_str)
-
-            if len(match):
-                match = match[0]
-            else:
-                match = [''] * 5
-
-            n_periods = match[2].lower()
-            period = match[3].lower()
-            is_multiple = (match[4] == 's')
-
-            logger.info(f'Parsed date: {relative_date_str} -> '
-                        f'n_periods: {n_periods}, '
-                        f'period: {period}, '
-                        f'is_multiple: {is_multiple}')
-
-            if period in PERIOD2LENGTH:
-                logger.info('Parsing as a relative date with period')
-
-                n_periods = NATURAL2INT.get(n_periods, n_periods)
-                try:
-                    n_periods = int(n_periods)
-                except (ValueError, TypeError):
-                    # recent years vs recent year
-                    n_periods = 3 if is_multiple else 1  # FIXME
-
-                delta_days = n_periods * PERIOD2LENGTH[period]
-                start_date = today - timedelta(days=delta_days)
-                end_date = today
-            elif 'late' in relative_date_str or 'recent' in relative_date_str or 'current' in relative_date_str:
-                logger.info('Parsing as a simple relative date')
-
-                # lately, latest, recently, most recent, currently, etc.
-                start_date = today - timedelta(days=365)
-                end_date = today
-            else:
-                logger.info('Parsing as an absolute date')
-
-                # absolute date
-                start_date = dateparser.parse(relative_date_str, settings=first_settings)
-                end_date = dateparser.parse(relative_date_str, settings=last_settings)
-
-            return start_date.strftime(DATE_FORMAT), end_date.strftime(DATE_FORMAT)
-
         dates = []
 
         for entity in entities:
@@ -266,18 +151,16 @@ class MapEntitiesToSlotsAction(Action):
             if entity_name == 'date':
                 dates.append(slot_value)
 
-        if len(dates) == 1:
-            start_date, end_date = parse_date(dates[0])
-            events.append(SlotSet('start_date', start_date))
-            events.append(SlotSet('end_date', end_date))
-        elif len(dates) > 1:
-            sorted_dates = sorted(dates, key=lambda x: dateparser.parse(x))
+        # every date is resolved once into the period it refers to, the slots span all of them
+        periods = [period for period in map(resolve_period, dates) if period is not None]
+        if len(periods) < len(dates):
+            logger.warning(f'Could not parse some of the dates: {dates}')
 
-            start_date = dateparser.parse(sorted_dates[0], settings=first_settings).strftime(DATE_FORMAT)
-            events.append(SlotSet('start_date', start_date))
-
-            end_date = dateparser.parse(sorted_dates[-1], settings=last_settings).strftime(DATE_FORMAT)
-            events.append(SlotSet('end_date', end_date))
+        if len(periods):
+            start_date = min(start_date for start_date, _ in periods)
+            end_date = max(end_date for _, end_date in periods)
+            events.append(SlotSet('start_date', start_date.strftime(DATE_FORMAT)))
+            events.append(SlotSet('end_date', end_date.strftime(DATE_FORMAT)))
 
         return events
 
@@ -340,7 +223,12 @@ class ActionAnalyzePrices(Action):
     def name(self) -> Text:
         return 'action_analyze_prices'
 
-    def run(self, dispatcher: CollectingDispatcher, tracker: Tracker, domain: DomainDict) -> List[Dict[Text, Any]]:
+    async def run(
+            self,
+            dispatcher: CollectingDispatcher,
+            tracker: Tracker,
+            domain: DomainDict
+    ) -> List[Dict[Text, Any]]:
         countries: list[str] = tracker.get_slot('countries')  # noqa
         commodities: list[str] = tracker.get_slot('commodities')  # noqa
         start_date = tracker.get_slot('start_date')
@@ -352,99 +240,174 @@ class ActionAnalyzePrices(Action):
                     f'\n\tstart_date={start_date}'
                     f'\n\tend_date={end_date}')
 
-        start_date, end_date = dateparser.parse(start_date), dateparser.parse(end_date)
+        start_date, end_date = parse_date(start_date), parse_date(end_date)
 
-        relevant_datasets = []
-        commodities_for_analysis = set()
+        # resolved country -> commodities to analyze in it
+        selection = {}
 
         for country in countries:
-            best_match, score = select_best_match(
-                country.lower().strip().replace(' ', ''),
-                COUNTRIES_DATASETS.keys()
-            )
+            best_match, score = DATASETS.country_matcher.best(country.lower().strip().replace(' ', ''))
             if score < 0.2:
                 dispatcher.utter_message(text=f'The country {country} is not supported yet. Sorry!')
                 return []
 
             country = best_match
-            dataset = COUNTRIES_DATASETS[country]
-
-            dataset['date'] = pd.to_datetime(dataset['date'])
-            dataset['price'] = dataset['price'].astype(float)
-            dataset['usdprice'] = dataset['usdprice'].astype(float)
-
-            possible_commodities = dataset.commodity.unique()
+            commodity_matcher = DATASETS.commodity_matcher(country)
 
-            target_commodities = []
+            target_commodities = selection.setdefault(country, [])
             for commodity in commodities:
-                best_commodity, score = select_best_match(
-                    commodity.lower().strip().replace(' ', ''),
-                    possible_commodities
-                )
+                best_commodity, score = commodity_matcher.best(commodity.lower().strip().replace(' ', ''))
 
                 if best_commodity is not None and (score > 0.2 or commodity.lower() in best_commodity.lower()):
                     target_commodities.append(best_commodity)
 
             logger.info(f'target commodities for {country}: {target_commodities}')
-            commodities_for_analysis.update(target_commodities)
 
-            dataset_filtered = dataset[(dataset['commodity'].isin(target_commodities)) &
-                                       (dataset['date'] >= start_date) &
-                                       (dataset['date'] <= end_date)].reset_index()
+        commodities_for_analysis = set().union(*selection.values())
+        price_column = 'price' if len(countries) < 2 else 'usdprice'
+
+        # relative dates are already resolved in the slots, so repeated questions share the key for a day;
+        # dataset versions change whenever the files are rewritten, which retires all the older entries
+        cache_key = (
+            tuple((country, tuple(sorted(set(selection[country])))) for country in sorted(selection)),
+            start_date.date(),
+            end_date.date(),
+            price_column,
+            tuple(DATASETS.version(country) for country in sorted(selection)),
+        )
+
+        cached = RESULTS.get(cache_key)
+        if cached is not None and all(CHARTS.get(chart_id) is not None for chart_id in cached[1]):
+            logger.info(f'Reusing cached analysis, cache stats: {RESULTS.stats()}')
+            filtered_df, chart_ids = cached
+        else:
+            # long periods are answered from the monthly rollups, short ones need the weekly buckets of the raw rows,
+            # the data spans at most the requested period, so rollups are not read at all for short ones
+            filtered_df, frequency = None, None
+            if bucket_frequency(end_date - start_date) != 'W':
+                filtered_df = self.select_rollups(selection, start_date, end_date)
+            if filtered_df is not None:
+                frequency = bucket_frequency(filtered_df['date'].max() - filtered_df['date'].min())
 
-            logger.info(f'dataset size for {country}: {len(dataset_filtered)}')
+            if frequency is None or frequency == 'W':
+                filtered_df, frequency = self.select(selection, start_date, end_date), None
 
-            dataset_filtered['country'] = country
-            relevant_datasets.append(dataset_filtered)
+            chart_ids = []
+            if len(filtered_df):
+                chart_ids = await self.plot(filtered_df, price_column, len(countries), frequency)
 
-        filtered_df = pd.concat(relevant_datasets, ignore_index=True)
+            # the charts themselves are kept on disk by the chart store
+            RESULTS.put(cache_key, (filtered_df, chart_ids), int(filtered_df.memory_usage(deep=True).sum()))
 
         if not len(filtered_df):
             dispatcher.utter_message(text=f'No data found for the period from {start_date.strftime("%Y-%m-%d")} '
                                           f'to {end_date.strftime("%Y-%m-%d")}')
             return []
 
-        price_column = 'price' if len(countries) < 2 else 'usdprice'
-        currency = filtered_df.currency.unique()[0] if len(countries) < 2 else 'USD'
-
-        image_paths = []
-
-        for sales_type in ['Wholesale', 'Retail']:
-            df = filtered_df[filtered_df.pricetype == sales_type]
-            if len(df):
-                # Plotting the price dynamic using seaborn
-                plt.figure(figsize=(10, 6))
-                sns.lineplot(
-                    data=df,
-                    x='date',
-                    y=price_column,
-                    hue='commodity',
-                    style='country'
-                )
-
-                # Customizing the plot
-                plt.title(f'Price Dynamics ({sales_type})')
-                plt.xlabel('Date')
-                plt.ylabel(f'Price ({currency})')
-                plt.xticks(rotation=45)
-                plt.grid(True)
-
-                # Save the plot to a temporary file
-                with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as f:
-                    plt.savefig(f.name)
-                    image_paths.append(f.name)
-
-                plt.clf()
-
         dispatcher.utter_message(text=f'Showing the price trend '
                                       f'for {", ".join(commodities_for_analysis)} '
                                       f'in {", ".join(countries)} countries '
                                       f'for {start_date.strftime(DATE_FORMAT)} - {end_date.strftime(DATE_FORMAT)} '
-                                      f'time period', image=f'{image_paths}')
+                                      f'time period', image=f'{chart_ids}')
 
         # Set slots with analysis result
         return []
 
+    @staticmethod
+    def select(selection: Dict[str, List[str]], start_date: datetime, end_date: datetime) -> pd.DataFrame:
+        consolidated = DATASETS.consolidated() if len(selection) > 1 else None
+        if consolidated is not None:
+            # all countries are sliced from a single frame, which already has the country column
+            pairs = [(country, commodity) for country, commodities in selection.items() for commodity in commodities]
+            filtered_df = consolidated.select(pairs, start_date, end_date).reset_index(drop=True)
+            logger.info(f'dataset size for {", ".join(selection)}: {len(filtered_df)}')
+        else:
+            relevant_datasets = []
+
+            for country, target_commodities in selection.items():
+                dataset_filtered = DATASETS.index(country).select(target_commodities, start_date, end_date)
+                dataset_filtered = dataset_filtered.reset_index(drop=True)
+
+                logger.info(f'dataset size for {country}: {len(dataset_filtered)}')
+
+                dataset_filtered['country'] = country
+                relevant_datasets.append(dataset_filtered)
+
+            filtered_df = pd.concat(relevant_datasets, ignore_index=True)
+
+        # drop categories of commodities and countries that are not plotted
+        filtered_df['commodity'] = filtered_df['commodity'].astype(str)
+        filtered_df['country'] = filtered_df['country'].astype(str)
+        return filtered_df
+
+    @staticmethod
+    def select_rollups(
+            selection: Dict[str, List[str]],
+            start_date: datetime,
+            end_date: datetime
+    ) -> Optional[pd.DataFrame]:
+        """Monthly rollup rows within the period, None if any of the countries has no rollup."""
+        relevant_rollups = []
+
+        for country, target_commodities in selection.items():
+            rollup = DATASETS.rollup(country)
+            if rollup is None:
+                return None
+
+            # the rollup of a month is dated by its first day, which may precede the start date
+            month_start = start_date.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+            rollup_filtered = rollup.select(target_commodities, month_start, end_date).reset_index(drop=True)
+            rollup_filtered['country'] = country
+            relevant_rollups.append(rollup_filtered)
+
+        rollups_df = pd.concat(relevant_rollups, ignore_index=True)
+        if not len(rollups_df):
+            return None
+
+        return rollups_df
+
+    @staticmethod
+    async def plot(
+            filtered_df: pd.DataFrame,
+            price_column: str,
+            n_countries: int,
+            frequency: Optional[str] = None
+    ) -> List[str]:
+        """Renders the charts missing from the chart store and returns the IDs of all of them.
+
+        Rows are market prices, aggregated into buckets sized to the period, or monthly rollups when the frequency of
+        the buckets is given.
+        """
+        currency = filtered_df.currency.unique()[0] if n_countries < 2 else 'USD'
+
+        chart_ids = []
+        charts = []
+        for sales_type in ['Wholesale', 'Retail']:
+            df = filtered_df[filtered_df.pricetype == sales_type]
+            if len(df):
+                title = f'Price Dynamics ({sales_type})'
+                ylabel = f'Price ({currency})'
+
+                # only a few points per series are plotted, however long the period is
+                if frequency is None:
+                    series = aggregate_prices(df, price_column)
+                else:
+                    series = aggregate_rollup(df, price_column, frequency)
+
+                chart_id = CHARTS.chart_id(series, {'title': title, 'ylabel': ylabel})
+                chart_ids.append(chart_id)
+                if CHARTS.get(chart_id) is None:
+                    charts.append(ActionAnalyzePrices.render(chart_id, series, title, ylabel))
+
+        # both price types are rendered at the same time
+        await asyncio.gather(*charts)
+        return chart_ids
+
+    @staticmethod
+    async def render(chart_id: str, series: pd.DataFrame, title: str, ylabel: str):
+        with CHARTS.writing(chart_id) as path:
+            await render(series, title, ylabel, str(path))
+
 
 class ActionDeactivateLoop(Action):
     def name(self) -> str:
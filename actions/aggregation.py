@@ -0,0 +1,61 @@
+from datetime import timedelta
+
+import pandas as pd
+
+# largest date span for each bucket size, the coarsest one covers everything longer
+BUCKETS = [
+    (timedelta(days=2 * 365), 'W'),
+    (timedelta(days=10 * 365), 'MS'),
+]
+LONGEST_BUCKET = 'QS'
+
+SERIES_COLUMNS = ['country', 'commodity', 'pricetype']
+STATISTICS = ['mean', 'median', 'q25', 'q75']
+
+
+def bucket_frequency(span: timedelta) -> str:
+    """Weekly, monthly or quarterly buckets, so the number of points per series stays roughly the same."""
+    for max_span, frequency in BUCKETS:
+        if span <= max_span:
+            return frequency
+
+    return LONGEST_BUCKET
+
+
+def aggregate_prices(df: pd.DataFrame, price_column: str) -> pd.DataFrame:
+    """Mean, median and quartiles of the market prices per series and time bucket."""
+    frequency = bucket_frequency(df['date'].max() - df['date'].min())
+
+    grouped = df.groupby([*SERIES_COLUMNS, pd.Grouper(key='date', freq=frequency)], observed=True)[price_column]
+    quartiles = grouped.quantile([0.25, 0.75]).unstack()
+
+    aggregated = pd.DataFrame({
+        'mean': grouped.mean(),
+        'median': grouped.median(),
+        'q25': quartiles[0.25],
+        'q75': quartiles[0.75],
+        'rows': grouped.size(),
+    })
+
+    return aggregated.dropna(subset=['mean']).reset_index()
+
+
+def aggregate_rollup(rollup: pd.DataFrame, price_column: str, frequency: str) -> pd.DataFrame:
+    """The same series as `aggregate_prices`, built from monthly rollups instead of market prices.
+
+    Monthly buckets are taken as they are. Coarser buckets weigh the monthly means by their number of rows, while
+    the median and quartiles are averaged over the months, which approximates the statistics of the raw prices.
+    """
+    series = rollup.rename(columns={f'{price_column}_{statistic}': statistic for statistic in STATISTICS})
+    series = series[[*SERIES_COLUMNS, 'date', *STATISTICS, 'rows']].dropna(subset=['mean']).reset_index(drop=True)
+    if frequency == 'MS':
+        return series
+
+    series = series.assign(total=series['mean'] * series['rows'])
+    grouped = series.groupby([*SERIES_COLUMNS, pd.Grouper(key='date', freq=frequency)])
+
+    aggregated = grouped.agg(total=('total', 'sum'), median=('median', 'mean'), q25=('q25', 'mean'),
+                             q75=('q75', 'mean'), rows=('rows', 'sum'))
+    aggregated.insert(0, 'mean', aggregated.pop('total') / aggregated['rows'])
+
+    return aggregated.dropna(subset=['mean']).reset_index()
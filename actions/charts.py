@@ -0,0 +1,88 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# shared with the streamlit application, which loads the charts by their IDs
+CHARTS_PATH = Path(os.getenv('CHART_STORE_PATH', 'charts'))
+DEFAULT_QUOTA_MB = 256
+
+
+class ChartStore:
+    """PNG charts named by a hash of the plotted data and style, kept under a disk quota in LRU order.
+
+    The contract with readers is the directory alone: a chart with ID `x` is the file `x.png`. Reading a chart through
+    the store marks it as recently used, so charts that are still displayed survive garbage collection.
+    """
+
+    def __init__(self, path: Path = CHARTS_PATH, quota_mb: float = DEFAULT_QUOTA_MB):
+        self.path = path
+        self.quota = int(quota_mb * 1024 * 1024)
+        self._lock = threading.Lock()
+
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def chart_id(df: pd.DataFrame, style: Dict[str, Any]) -> str:
+        checksum = hashlib.sha256()
+        checksum.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+        checksum.update(json.dumps(list(df.columns)).encode())
+        checksum.update(json.dumps(style, sort_keys=True).encode())
+        return checksum.hexdigest()
+
+    def chart_path(self, chart_id: str) -> Path:
+        return self.path.joinpath(f'{chart_id}.png')
+
+    def get(self, chart_id: str) -> Optional[Path]:
+        path = self.chart_path(chart_id)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+
+        return path
+
+    @contextmanager
+    def writing(self, chart_id: str) -> Iterator[Path]:
+        """Yields a temporary path for the chart, which is published under its ID once completely written."""
+        tmp_path = self.path.joinpath(f'.{chart_id}.{uuid.uuid4().hex}.tmp')
+        try:
+            yield tmp_path
+            os.replace(tmp_path, self.chart_path(chart_id))
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+
+        self.collect_garbage()
+
+    def collect_garbage(self):
+        with self._lock:
+            charts = []
+            for path in self.path.glob('*.png'):
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                charts.append((stat.st_mtime, stat.st_size, path))
+
+            total = sum(size for _, size, _ in charts)
+            for _, size, path in sorted(charts):
+                if total <= self.quota:
+                    break
+
+                path.unlink(missing_ok=True)
+                total -= size
+                logger.info(f'Removed chart {path.stem} from the store')
+
+
+def store_from_env() -> ChartStore:
+    return ChartStore(quota_mb=float(os.getenv('CHART_STORE_QUOTA_MB', DEFAULT_QUOTA_MB)))
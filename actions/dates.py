@@ -0,0 +1,115 @@
+import logging
+import re
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DATE_FORMAT = '%Y-%m-%d'
+REGEX_RELATIVE_DATE = re.compile(r'(recent|latest|last|past|previous|current)'
+                                 r'(\s+(.*))?'  # [2] capture group is number days/weeks etc.
+                                 r'\s+(year|month|quarter|week|day|decade)(s)?')  # [3] capture group will is a period
+
+PERIOD2LENGTH = {
+    'year': 365,
+    'month': 30,
+    'quarter': 91,
+    'week': 7,
+    'day': 1,
+    'decade': 3650
+}
+
+NATURAL2INT = {
+    'couple': 2,
+    'few': 3,
+    'several': 4,
+    'dozen': 12,
+    'half-dozen': 6,
+}
+
+FIRST_SETTINGS = {
+    'PREFER_DAY_OF_MONTH': 'first',
+    'PREFER_MONTH_OF_YEAR': 'first'
+}
+LAST_SETTINGS = {
+    'PREFER_DAY_OF_MONTH': 'last',
+    'PREFER_MONTH_OF_YEAR': 'last'
+}
+
+CACHE_SIZE = 4096
+
+
+def parse_date(text: str, settings: Optional[Dict[str, str]] = None) -> Optional[datetime]:
+    """`dateparser.parse` with a fast path for dates in `DATE_FORMAT`, which is how the slots store them."""
+    try:
+        return datetime.strptime(text.strip(), DATE_FORMAT)
+    except ValueError:
+        pass
+
+    # relative dates depend on the current day, so it is a part of the key
+    return _parse_date(text, tuple(sorted((settings or {}).items())), date.today())
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _parse_date(text: str, settings: Tuple[Tuple[str, str], ...], today: date) -> Optional[datetime]:
+    # imported on the first date the fast path cannot handle, it takes longer to import than the rest of the server
+    import dateparser
+
+    return dateparser.parse(text, settings=dict(settings))
+
+
+def resolve_period(text: str) -> Optional[Tuple[datetime, datetime]]:
+    """First and last day of the period a date entity refers to, None if it is not a date."""
+    return _resolve_period(text, date.today())
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _resolve_period(text: str, today: date) -> Optional[Tuple[datetime, datetime]]:
+    today = datetime.combine(today, time())
+
+    # assume relative date
+    match = REGEX_RELATIVE_DATE.findall(text)
+
+    if len(match):
+        match = match[0]
+    else:
+        match = [''] * 5
+
+    n_periods = match[2].lower()
+    period = match[3].lower()
+    is_multiple = (match[4] == 's')
+
+    logger.info(f'Parsed date: {text} -> '
+                f'n_periods: {n_periods}, '
+                f'period: {period}, '
+                f'is_multiple: {is_multiple}')
+
+    if period in PERIOD2LENGTH:
+        logger.info('Parsing as a relative date with period')
+
+        n_periods = NATURAL2INT.get(n_periods, n_periods)
+        try:
+            n_periods = int(n_periods)
+        except (ValueError, TypeError):
+            # recent years vs recent year
+            n_periods = 3 if is_multiple else 1  # FIXME
+
+        delta_days = n_periods * PERIOD2LENGTH[period]
+        return today - timedelta(days=delta_days), today
+
+    if 'late' in text or 'recent' in text or 'current' in text:
+        logger.info('Parsing as a simple relative date')
+
+        # lately, latest, recently, most recent, currently, etc.
+        return today - timedelta(days=365), today
+
+    logger.info('Parsing as an absolute date')
+
+    # absolute date
+    start_date = parse_date(text, FIRST_SETTINGS)
+    end_date = parse_date(text, LAST_SETTINGS)
+    if start_date is None or end_date is None:
+        return None
+
+    return start_date, end_date
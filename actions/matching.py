@@ -0,0 +1,107 @@
+from collections import defaultdict
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+
+def strip_chars(s: str) -> str:
+    return (s.strip().lower()
+            .replace(' ', '')
+            .replace('(', '')
+            .replace(')', '')
+            .replace('-', ''))
+
+
+def match_score(d1: str, d2: str) -> float:
+    d1 = strip_chars(d1)
+    d2 = strip_chars(d2)
+    end = 0
+    for end in reversed(range(len(d1) + 1)):
+        substr = d1[:end]
+        if substr in d2:
+            break
+
+    return (1 - (len(d1) - end) / len(d1)) * (len(d1) / len(d2))
+
+
+def select_best_match(target: str, candidates: Iterable[str]) -> Tuple[Optional[str], float]:
+    best_match = 0.0
+    best_matched_candidate = None
+
+    for candidate in candidates:
+        curr_match = match_score(target, candidate)
+        if curr_match > best_match:
+            best_match = curr_match
+            best_matched_candidate = candidate
+
+    return best_matched_candidate, best_match
+
+
+class Matcher:
+    """Scores targets against a fixed vocabulary the same way as `match_score`.
+
+    The score depends on the longest prefix of the target found in a candidate. Candidates containing a prefix
+    always contain all the shorter ones, so prefixes are grown while narrowing down the candidates, starting from
+    an index of all short substrings.
+    """
+
+    def __init__(self, candidates: Iterable[str], ngram: int = 3):
+        self.candidates = list(dict.fromkeys(candidates))
+        self.normalized = [strip_chars(candidate) for candidate in self.candidates]
+        self.ngram = ngram
+
+        index: Dict[str, Set[int]] = defaultdict(set)
+        for i, normalized in enumerate(self.normalized):
+            for n in range(1, ngram + 1):
+                for start in range(len(normalized) - n + 1):
+                    index[normalized[start:start + n]].add(i)
+
+        self._index: Dict[str, FrozenSet[int]] = {substr: frozenset(ids) for substr, ids in index.items()}
+
+    def __len__(self) -> int:
+        return len(self.candidates)
+
+    def scores(self, target: str) -> Dict[int, float]:
+        """Non-zero scores by candidate position."""
+        query = strip_chars(target)
+        if not len(query):
+            return {}
+
+        # candidate -> length of the longest prefix of the query it contains
+        ends = {}
+        alive: FrozenSet[int] = frozenset()
+        for end in range(1, len(query) + 1):
+            prefix = query[:end]
+            if end <= self.ngram:
+                survivors = self._index.get(prefix, frozenset())
+            else:
+                survivors = frozenset(i for i in alive if prefix in self.normalized[i])
+
+            for i in alive - survivors:
+                ends[i] = end - 1
+
+            alive = survivors
+            if not len(alive):
+                break
+        else:
+            for i in alive:
+                ends[i] = len(query)
+
+        return {
+            i: (1 - (len(query) - end) / len(query)) * (len(query) / len(self.normalized[i]))
+            for i, end in ends.items()
+        }
+
+    def best(self, target: str) -> Tuple[Optional[str], float]:
+        """Same result as `select_best_match` over the vocabulary: the first of the best scored candidates."""
+        best_match = 0.0
+        best_matched_candidate = None
+
+        for i, score in sorted(self.scores(target).items()):
+            if score > best_match:
+                best_match = score
+                best_matched_candidate = self.candidates[i]
+
+        return best_matched_candidate, best_match
+
+    def top_k(self, target: str, k: int = 5) -> List[Tuple[str, float]]:
+        ranked = sorted(self.scores(target).items(), key=lambda item: (-item[1], item[0]))
+        return [(self.candidates[i], score) for i, score in ranked[:k]]
@@ -0,0 +1,136 @@
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+class PriceIndex:
+    """Price rows of a single country sorted by commodity, then date.
+
+    Each commodity occupies a contiguous block of rows, so a date range within it is found with two binary searches.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        df = df.sort_values(['commodity', 'date'], kind='stable').reset_index(drop=True)
+        # commodity blocks are stored as categories even if the frame came from a plain CSV
+        commodities = df['commodity'].astype(str).to_numpy()
+
+        self.frame = df
+        self.dates = df['date'].to_numpy()
+        self.offsets: Dict[str, Tuple[int, int]] = {}
+
+        if len(commodities):
+            boundaries = np.flatnonzero(commodities[1:] != commodities[:-1]) + 1
+            starts = np.concatenate([[0], boundaries])
+            stops = np.concatenate([boundaries, [len(commodities)]])
+            for start, stop in zip(starts, stops):
+                self.offsets[commodities[start]] = (int(start), int(stop))
+
+    def __len__(self) -> int:
+        return len(self.frame)
+
+    def _range(self, commodity: str, start_date: datetime, end_date: datetime) -> Tuple[int, int]:
+        if commodity not in self.offsets:
+            return 0, 0
+
+        lo, hi = self.offsets[commodity]
+        dates = self.dates[lo:hi]
+        return (lo + int(np.searchsorted(dates, np.datetime64(start_date), side='left')),
+                lo + int(np.searchsorted(dates, np.datetime64(end_date), side='right')))
+
+    def select(self, commodities: Iterable[str], start_date: datetime, end_date: datetime) -> pd.DataFrame:
+        """Rows for the given commodities between start and end date, both inclusive."""
+        ranges = [self._range(commodity, start_date, end_date) for commodity in dict.fromkeys(commodities)]
+        positions = [np.arange(lo, hi) for lo, hi in ranges if hi > lo]
+
+        if not len(positions):
+            positions = [np.arange(0)]
+
+        # a copy of the rows, the shared frame is never handed out
+        return self.frame.take(np.concatenate(positions))
+
+    def span(self, commodity: str, start_date: datetime, end_date: datetime) -> Optional[Tuple[datetime, datetime]]:
+        """First and last date with data for the commodity within the period, without touching the rows."""
+        lo, hi = self._range(commodity, start_date, end_date)
+        if hi <= lo:
+            return None
+
+        return pd.Timestamp(self.dates[lo]), pd.Timestamp(self.dates[hi - 1])
+
+
+class ConsolidatedIndex:
+    """Price rows of all countries sorted by commodity, country, then date.
+
+    Every row is addressed by a single integer combining the category codes of its commodity and country with its day,
+    so the date ranges of any number of (country, commodity) pairs are found with one vectorized binary search and the
+    rows are gathered from one frame, without concatenating per-country copies.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        df = df[df['date'].notna()]
+        # sorted categories, so the order of the codes is the order of the values
+        commodities = df['commodity'].astype(str).astype('category')
+        countries = df['country'].astype(str).astype('category')
+        df = df.assign(commodity=commodities, country=countries)
+
+        keys = self._keys(commodities.cat.codes.to_numpy(), countries.cat.codes.to_numpy(), df['date'].to_numpy())
+        order = np.argsort(keys, kind='stable')
+
+        self.frame = df.iloc[order].reset_index(drop=True)
+        self.keys = keys[order]
+        self.dates = self.frame['date'].to_numpy()
+        self.commodity_codes = {commodity: code for code, commodity in enumerate(commodities.cat.categories)}
+        self.country_codes = {country: code for code, country in enumerate(countries.cat.categories)}
+
+    def __len__(self) -> int:
+        return len(self.frame)
+
+    @staticmethod
+    def _keys(commodity_codes: np.ndarray, country_codes: np.ndarray, dates: np.ndarray) -> np.ndarray:
+        # 16 bits of commodity, 16 bits of country and 32 bits of days, shifted to be non-negative
+        days = dates.astype('datetime64[D]').astype(np.int64) + 2 ** 31
+        return (commodity_codes.astype(np.int64) << 48) | (country_codes.astype(np.int64) << 32) | days
+
+    def _ranges(
+            self,
+            pairs: Iterable[Tuple[str, str]],
+            start_date: datetime,
+            end_date: datetime
+    ) -> Tuple[List[Tuple[str, str]], np.ndarray, np.ndarray]:
+        pairs = [
+            (country, commodity) for country, commodity in dict.fromkeys(pairs)
+            if country in self.country_codes and commodity in self.commodity_codes
+        ]
+        commodity_codes = np.array([self.commodity_codes[commodity] for _, commodity in pairs], dtype=np.int64)
+        country_codes = np.array([self.country_codes[country] for country, _ in pairs], dtype=np.int64)
+
+        lower = self._keys(commodity_codes, country_codes, np.full(len(pairs), np.datetime64(start_date, 'D')))
+        upper = self._keys(commodity_codes, country_codes, np.full(len(pairs), np.datetime64(end_date, 'D')))
+        return pairs, np.searchsorted(self.keys, lower, side='left'), np.searchsorted(self.keys, upper, side='right')
+
+    def select(self, pairs: Iterable[Tuple[str, str]], start_date: datetime, end_date: datetime) -> pd.DataFrame:
+        """Rows for the given (country, commodity) pairs between start and end date, both inclusive."""
+        _, starts, stops = self._ranges(pairs, start_date, end_date)
+        # a start after the end is an empty range
+        lengths = np.maximum(stops - starts, 0)
+
+        # positions of all the ranges one after another, the offset of every range is repeated for its rows
+        offsets = np.cumsum(lengths) - lengths
+        positions = np.repeat(starts - offsets, lengths) + np.arange(lengths.sum())
+        return self.frame.take(positions)
+
+    def spans(
+            self,
+            pairs: Iterable[Tuple[str, str]],
+            start_date: datetime,
+            end_date: datetime
+    ) -> Dict[Tuple[str, str], Tuple[datetime, datetime]]:
+        """First and last date with data within the period for every pair that has any."""
+        pairs, starts, stops = self._ranges(pairs, start_date, end_date)
+        found = stops > starts
+
+        first_dates = pd.DatetimeIndex(self.dates[starts[found]])
+        last_dates = pd.DatetimeIndex(self.dates[stops[found] - 1])
+        pairs = [pair for pair, has_data in zip(pairs, found) if has_data]
+        return dict(zip(pairs, zip(first_dates, last_dates)))
@@ -0,0 +1,230 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Set, Optional, Tuple, Union
+
+import pandas as pd
+
+from actions.matching import Matcher
+from actions.query import PriceIndex, ConsolidatedIndex
+from datasets.storage import (
+    DATA_PATH, list_countries, read_dataset, read_manifest, build_manifest, to_typed, read_coverage, dataset_version,
+    read_rollup, rollup_version, read_consolidated, consolidated_version
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MEMORY_BUDGET_MB = 512
+
+
+class DatasetRegistry:
+    """Country datasets and their monthly rollups loaded on first request and evicted in LRU order once the memory
+    budget is exceeded.
+
+    Frames are converted to their final dtypes once, when loaded. The frame of an index is shared by concurrent
+    requests and must not be modified, its `select` returns a copy of the selected rows instead.
+    """
+
+    def __init__(self, data_path: Path = DATA_PATH, memory_budget_mb: float = DEFAULT_MEMORY_BUDGET_MB):
+        self.data_path = data_path
+        self.memory_budget = int(memory_budget_mb * 1024 * 1024)
+
+        self._lock = threading.RLock()
+        # keyed by the kind of table and the country, datasets and rollups share the budget
+        self._indexes: 'OrderedDict[Tuple[str, str], Union[PriceIndex, ConsolidatedIndex]]' = OrderedDict()
+        self._sizes: Dict[Tuple[str, str], int] = {}
+        self._versions: Dict[Tuple[str, str], int] = {}
+        self._countries: List[str] = []
+        self._commodities: Dict[str, List[str]] = {}
+        self._commodity_matchers: Dict[str, Matcher] = {}
+        self.country_matcher = Matcher([])
+        self._coverage: Optional[Dict[Tuple[str, str], Tuple[datetime, datetime]]] = None
+
+        self.refresh()
+
+    @property
+    def countries(self) -> List[str]:
+        return self._countries
+
+    @property
+    def all_commodities(self) -> Set[str]:
+        return set().union(*self._commodities.values())
+
+    @property
+    def memory_usage(self) -> int:
+        return sum(self._sizes.values())
+
+    def __contains__(self, country: str) -> bool:
+        return country in self._commodities
+
+    def __len__(self) -> int:
+        return len(self._countries)
+
+    def refresh(self):
+        """Rescans the data directory and drops all loaded frames."""
+        countries = list_countries(self.data_path)
+        manifest = read_manifest(self.data_path)
+
+        missing = [country for country in countries if country not in manifest]
+        if len(missing):
+            logger.warning(f'No manifest entry for {", ".join(missing)}, reading commodities from the datasets')
+            manifest.update(build_manifest(missing, self.data_path))
+
+        coverage = read_coverage(self.data_path)
+        if coverage is not None:
+            # pricetypes are not distinguished when reporting the available periods
+            coverage = coverage.groupby(['country', 'commodity']).agg(first_date=('first_date', 'min'),
+                                                                      last_date=('last_date', 'max'))
+            coverage = {
+                key: (row.first_date, row.last_date)
+                for key, row in zip(coverage.index, coverage.itertuples())
+            }
+        else:
+            logger.warning('No coverage table found, available periods will be computed from the datasets')
+
+        with self._lock:
+            self._countries = countries
+            self._commodities = {country: manifest[country]['commodities'] for country in countries}
+            self._commodity_matchers = {}
+            self.country_matcher = Matcher(countries)
+            self._coverage = coverage
+            self._indexes.clear()
+            self._sizes.clear()
+            self._versions.clear()
+
+    def commodities(self, country: str) -> List[str]:
+        return self._commodities[country]
+
+    def commodity_matcher(self, country: str) -> Matcher:
+        matcher = self._commodity_matchers.get(country)
+        if matcher is None:
+            matcher = self._commodity_matchers[country] = Matcher(self._commodities[country])
+
+        return matcher
+
+    def _covered_span(
+            self,
+            country: str,
+            commodity: str,
+            start_date: datetime,
+            end_date: datetime
+    ) -> Tuple[bool, Optional[Tuple[datetime, datetime]]]:
+        """Whether the coverage table alone answers the query, and the answer."""
+        if self._coverage is None:
+            return False, None
+
+        span = self._coverage.get((country, commodity))
+        if span is None:
+            return True, None
+
+        first_date, last_date = span
+        if start_date <= first_date and last_date <= end_date:
+            return True, span
+
+        return False, None
+
+    def version(self, country: str) -> int:
+        """Changes whenever the dataset of the country is rewritten."""
+        return dataset_version(country, self.data_path)
+
+    def index(self, country: str) -> PriceIndex:
+        if country not in self:
+            raise KeyError(country)
+
+        return self._load(('dataset', country), self.version(country),
+                          lambda: to_typed(read_dataset(country, self.data_path)))
+
+    def rollup(self, country: str) -> Optional[PriceIndex]:
+        """Monthly rollup of the dataset, None for datasets stored before rollups were introduced."""
+        if country not in self:
+            raise KeyError(country)
+
+        version = rollup_version(country, self.data_path)
+        if version is None:
+            return None
+
+        return self._load(('rollup', country), version, lambda: read_rollup(country, self.data_path))
+
+    def consolidated(self) -> Optional[ConsolidatedIndex]:
+        """All countries in one index, None if it is missing or older than any of the datasets."""
+        version = consolidated_version(self.data_path)
+        if version is None or any(self.version(country) > version for country in self._countries):
+            return None
+
+        return self._load(('consolidated', 'all countries'), version, lambda: read_consolidated(self.data_path),
+                          ConsolidatedIndex)
+
+    def spans(
+            self,
+            pairs: Iterable[Tuple[str, str]],
+            start_date: datetime,
+            end_date: datetime
+    ) -> Dict[Tuple[str, str], Tuple[datetime, datetime]]:
+        """First and last date with data within the period for every (country, commodity) pair that has any.
+
+        Answered from the coverage table whenever the period contains all the data of a pair, otherwise from the index.
+
+        Pairs the coverage table does not answer are looked up all at once in the consolidated index when they span
+        several countries, instead of loading the dataset of every country.
+        """
+        pairs = list(dict.fromkeys(pairs))
+        spans = {}
+        remaining = []
+        for country, commodity in pairs:
+            covered, span = self._covered_span(country, commodity, start_date, end_date)
+            if not covered:
+                remaining.append((country, commodity))
+            elif span is not None:
+                spans[country, commodity] = span
+
+        consolidated = self.consolidated() if len({country for country, _ in remaining}) > 1 else None
+        if consolidated is not None:
+            spans.update(consolidated.spans(remaining, start_date, end_date))
+        else:
+            for country, commodity in remaining:
+                span = self.index(country).span(commodity, start_date, end_date)
+                if span is not None:
+                    spans[country, commodity] = span
+
+        # in the order of the requested pairs
+        return {pair: spans[pair] for pair in pairs if pair in spans}
+
+    def _load(
+            self,
+            key: Tuple[str, str],
+            version: int,
+            read: Callable[[], pd.DataFrame],
+            index_type: type = PriceIndex
+    ) -> Union[PriceIndex, ConsolidatedIndex]:
+        with self._lock:
+            if key in self._indexes and self._versions[key] == version:
+                self._indexes.move_to_end(key)
+                return self._indexes[key]
+
+        logger.info(f'Loading {key[0]} for {key[1]}')
+        index = index_type(read())
+
+        with self._lock:
+            self._indexes[key] = index
+            self._indexes.move_to_end(key)
+            self._sizes[key] = int(index.frame.memory_usage(deep=True).sum())
+            self._versions[key] = version
+            self._evict()
+
+        return index
+
+    def _evict(self):
+        # the most recently used frame is always kept, even if it alone exceeds the budget
+        while len(self._indexes) > 1 and self.memory_usage > self.memory_budget:
+            key, _ = self._indexes.popitem(last=False)
+            self._sizes.pop(key)
+            self._versions.pop(key)
+            logger.info(f'Evicted {key[0]} for {key[1]} from memory')
+
+
+def registry_from_env() -> DatasetRegistry:
+    memory_budget_mb = float(os.getenv('DATASETS_MEMORY_BUDGET_MB', DEFAULT_MEMORY_BUDGET_MB))
+    return DatasetRegistry(memory_budget_mb=memory_budget_mb)
@@ -0,0 +1,94 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+LINE_STYLES = ['-', '--', ':', '-.']
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def render_chart(series: pd.DataFrame, title: str, ylabel: str, path: str) -> str:
+    """Draws pre-aggregated price series on its own figure and saves it as PNG, runs in a worker process.
+
+    Colors distinguish commodities and line styles distinguish countries, the band spans the interquartile range
+    of the market prices in every time bucket.
+    """
+    # imported here, so only the rendering processes pay for the plotting library
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(10, 6))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+
+    commodities = list(dict.fromkeys(series['commodity']))
+    countries = list(dict.fromkeys(series['country']))
+
+    for (commodity, country), line in series.groupby(['commodity', 'country'], sort=False):
+        color = f'C{commodities.index(commodity) % 10}'
+        linestyle = LINE_STYLES[countries.index(country) % len(LINE_STYLES)]
+        label = commodity if len(countries) < 2 else f'{commodity} ({country})'
+
+        ax.plot(line['date'], line['mean'], color=color, linestyle=linestyle, label=label)
+        ax.fill_between(line['date'], line['q25'], line['q75'], color=color, alpha=0.2, linewidth=0)
+
+    # Customizing the plot
+    ax.set_title(title)
+    ax.set_xlabel('Date')
+    ax.set_ylabel(ylabel)
+    ax.tick_params(axis='x', labelrotation=45)
+    ax.grid(True)
+    ax.legend()
+
+    fig.savefig(path, format='png')
+    return path
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+
+    with _pool_lock:
+        if _pool is None:
+            max_workers = int(os.getenv('CHART_RENDER_WORKERS', 0)) or None
+            # spawn avoids forking the event loop and threads of the action server
+            _pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'))
+            logger.info('Started chart rendering pool')
+
+    return _pool
+
+
+def reset_pool(broken: ProcessPoolExecutor):
+    """Drops a pool whose worker died, the next `get_pool` starts a new one."""
+    global _pool
+
+    with _pool_lock:
+        # another request may have replaced it already
+        if _pool is broken:
+            _pool = None
+            logger.warning('Chart rendering pool is broken, restarting it')
+
+    broken.shutdown(wait=False)
+
+
+async def render(series: pd.DataFrame, title: str, ylabel: str, path: str) -> str:
+    """Renders the chart in the process pool without blocking the event loop.
+
+    A pool broken by a dead worker, e.g. killed for running out of memory, is replaced and the chart resubmitted once.
+    """
+    pool = get_pool()
+    try:
+        return await asyncio.wrap_future(pool.submit(render_chart, series, title, ylabel, path))
+    except BrokenProcessPool:
+        reset_pool(pool)
+
+    return await asyncio.wrap_future(get_pool().submit(render_chart, series, title, ylabel, path))
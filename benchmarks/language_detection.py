@@ -0,0 +1,111 @@
+"""Compares fastText language identification models by memory, load time and accuracy.
+
+Every model is measured in a fresh interpreter, so the resident memory of one does not include the other. Accuracy is
+measured on the NLU examples, which are English, and on the translated interface strings of the streamlit application.
+
+Usage: python -m benchmarks.language_detection lid.176.bin lid.176.ftz [--nlu data/nlu.yml]
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import pandas as pd
+
+from components.masking import NLU_PATH, nlu_examples, read_nlu
+
+TRANSLATIONS_PATH = Path('translations_cache.csv')
+
+
+def load_samples(nlu_path: Path, translations_path: Path) -> List[Tuple[str, str]]:
+    """(text, expected language) pairs."""
+    samples = [(text, 'en') for text in nlu_examples(read_nlu(nlu_path))]
+
+    if translations_path.exists():
+        translations = pd.read_csv(translations_path).dropna()
+        for text, language in zip(translations['translation'], translations['language']):
+            # fastText labels have no region, e.g. zh instead of zh-cn
+            samples.append((text, language.split('-')[0]))
+
+    return samples
+
+
+def resident_memory() -> int:
+    """Resident set size of the process in bytes."""
+    try:
+        with open('/proc/self/status') as file:
+            for line in file:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except FileNotFoundError:
+        pass
+
+    import resource
+    # kilobytes on Linux, bytes on macOS, only the peak is available without /proc
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def measure(model_file: str, nlu_path: Path, translations_path: Path) -> Dict:
+    import fasttext
+
+    samples = load_samples(nlu_path, translations_path)
+    texts = [' '.join(text.splitlines()) for text, _ in samples]
+
+    rss_before = resident_memory()
+    start = time.perf_counter()
+    model = fasttext.load_model(model_file)
+    load_seconds = time.perf_counter() - start
+    rss_after = resident_memory()
+
+    start = time.perf_counter()
+    labels, _ = model.predict(texts, k=1)
+    predict_seconds = time.perf_counter() - start
+
+    predicted = [label[0].split('__')[-1] if len(label) else '' for label in labels]
+    correct = [prediction == expected for prediction, (_, expected) in zip(predicted, samples)]
+    english = [is_correct for is_correct, (_, expected) in zip(correct, samples) if expected == 'en']
+    other = [is_correct for is_correct, (_, expected) in zip(correct, samples) if expected != 'en']
+
+    return {
+        'model': model_file,
+        'file_mb': Path(model_file).stat().st_size / 1024 / 1024,
+        'rss_mb': (rss_after - rss_before) / 1024 / 1024,
+        'load_s': load_seconds,
+        'predict_ms': predict_seconds / max(len(texts), 1) * 1000,
+        'accuracy': sum(correct) / max(len(correct), 1),
+        'accuracy_en': sum(english) / max(len(english), 1),
+        'accuracy_other': sum(other) / max(len(other), 1),
+        'samples': len(samples),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('models', nargs='+', help='model files, e.g. lid.176.bin lid.176.ftz')
+    parser.add_argument('--nlu', type=Path, default=NLU_PATH)
+    parser.add_argument('--translations', type=Path, default=TRANSLATIONS_PATH)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.models[0], args.nlu, args.translations)))
+        return
+
+    results = []
+    for model_file in args.models:
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.language_detection', model_file, '--child',
+             '--nlu', str(args.nlu), '--translations', str(args.translations)],
+            capture_output=True, text=True, check=True
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    print(pd.DataFrame(results).set_index('model').round(3).to_string())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""Compares the compiled Matcher with select_best_match over the country and commodity vocabulary of the datasets.
+
+Usage: python -m benchmarks.matching [--data-path datasets/data]
+"""
+import argparse
+import time
+from pathlib import Path
+from typing import Callable, List
+
+from actions.matching import Matcher, select_best_match
+from datasets.storage import DATA_PATH, list_countries, read_manifest, build_manifest
+
+
+def make_queries(vocabulary: List[str]) -> List[str]:
+    # exact names, lower-cased prefixes as typed by users, plurals and misspelled endings
+    queries = []
+    for word in vocabulary:
+        queries.extend([word, word.lower()[:max(3, len(word) // 2)], f'{word.lower()}s', f'{word[:-1]}x'])
+
+    return queries
+
+
+def time_per_query(match: Callable[[str], object], queries: List[str], repeats: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for query in queries:
+            match(query)
+
+    return (time.perf_counter() - start) / repeats / len(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data-path', type=Path, default=DATA_PATH)
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    countries = list_countries(args.data_path)
+    if not len(countries):
+        raise SystemExit(f'No datasets found in {args.data_path}')
+
+    manifest = read_manifest(args.data_path)
+    manifest.update(build_manifest([country for country in countries if country not in manifest], args.data_path))
+    commodities = sorted(set().union(*(manifest[country]['commodities'] for country in countries)))
+
+    for name, vocabulary in [('countries', countries), ('commodities', commodities)]:
+        queries = make_queries(vocabulary)
+
+        start = time.perf_counter()
+        matcher = Matcher(vocabulary)
+        build_seconds = time.perf_counter() - start
+
+        mismatches = sum(matcher.best(query) != select_best_match(query, vocabulary) for query in queries)
+
+        baseline = time_per_query(lambda query: select_best_match(query, vocabulary), queries, args.repeats)
+        compiled = time_per_query(matcher.best, queries, args.repeats)
+        print(f'{name}: {len(vocabulary)} candidates, {len(queries)} queries, {mismatches} mismatches')
+        print(f'    select_best_match: {baseline * 1e6:.1f} us/query')
+        print(f'    Matcher.best:      {compiled * 1e6:.1f} us/query ({build_seconds * 1e3:.1f} ms to build)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""Measures the cold start of the action server: how long importing the actions takes and which modules dominate it.
+
+Every run imports the module in a fresh interpreter with `python -X importtime`, so nothing is cached in memory.
+Run it from the directory the action server is started from, the datasets are found relative to it.
+
+Usage: python -m benchmarks.startup [--module actions.actions] [--runs 5] [--top 15]
+"""
+import argparse
+import re
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+# import time:  self [us] | cumulative | imported package
+IMPORT_TIME_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s+)(\S+)')
+
+
+def import_times(module: str) -> Tuple[float, Dict[str, Tuple[int, int]]]:
+    """Wall-clock seconds of one cold import and (self, cumulative) microseconds of top-level packages."""
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+
+    if result.returncode != 0:
+        raise SystemExit(f'Failed to import {module}:\n{result.stderr[-2000:]}')
+
+    packages: Dict[str, Tuple[int, int]] = {}
+    for line in result.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match is None:
+            continue
+
+        self_us, cumulative_us, indent, name = match.groups()
+        # only modules imported directly by the interpreter or the measured module, their children are included
+        if len(indent) <= 3:
+            packages[name] = (int(self_us), int(cumulative_us))
+
+    return elapsed, packages
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--module', default='actions.actions')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+
+    elapsed: List[float] = []
+    cumulative: Dict[str, List[int]] = {}
+    for _ in range(args.runs):
+        run_elapsed, packages = import_times(args.module)
+        elapsed.append(run_elapsed)
+        for name, (_, cumulative_us) in packages.items():
+            cumulative.setdefault(name, []).append(cumulative_us)
+
+    print(f'import {args.module}: median {statistics.median(elapsed):.3f}s, '
+          f'min {min(elapsed):.3f}s over {args.runs} cold runs')
+
+    ranked = sorted(cumulative.items(), key=lambda item: -statistics.median(item[1]))
+    print(f'{"module":<40} {"cumulative ms":>14}')
+    for name, times in ranked[:args.top]:
+        print(f'{name:<40} {statistics.median(times) / 1000:>14.1f}')
+
+
+if __name__ == '__main__':
+    main()
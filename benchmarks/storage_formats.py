@@ -0,0 +1,83 @@
+"""Compares cold load time and resident memory of the CSV and Parquet dataset stores.
+
+Usage: python -m benchmarks.storage_formats [--data-path datasets/data]
+"""
+import argparse
+import multiprocessing
+import resource
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import pandas as pd
+
+from datasets.storage import DATA_PATH, list_countries, dataset_path, store_path, to_typed
+
+
+def max_rss_mb() -> float:
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def load_all(paths: List[Path], store_format: str) -> Dict[str, float]:
+    rss_before = max_rss_mb()
+    start = time.perf_counter()
+
+    frames = []
+    for path in paths:
+        if store_format == 'csv':
+            df = pd.read_csv(path)
+            # the CSV still has to be converted before it can be queried
+            df['date'] = pd.to_datetime(df['date'])
+        else:
+            df = pd.read_parquet(path)
+        frames.append(df)
+
+    return {
+        'load_seconds': time.perf_counter() - start,
+        'rss_mb': max_rss_mb() - rss_before,
+        'frames_mb': sum(df.memory_usage(deep=True).sum() for df in frames) / 1024 / 1024,
+    }
+
+
+def run_cold(paths: List[Path], store_format: str) -> Dict[str, float]:
+    # a fresh interpreter for every run, so nothing is shared between the formats
+    with multiprocessing.get_context('spawn').Pool(1) as pool:
+        return pool.apply(load_all, (paths, store_format))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data-path', type=Path, default=DATA_PATH)
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    countries = list_countries(args.data_path)
+    if not len(countries):
+        raise SystemExit(f'No datasets found in {args.data_path}')
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_paths = [dataset_path(country, args.data_path) for country in countries]
+
+        parquet_paths = []
+        for country, csv_path in zip(countries, csv_paths):
+            path = store_path(country, args.data_path)
+            if not path.exists():
+                path = store_path(country, Path(tmp_dir))
+                to_typed(pd.read_csv(csv_path)).to_parquet(path, index=False)
+            parquet_paths.append(path)
+
+        print(f'{len(countries)} countries, best of {args.repeats} cold runs')
+        for store_format, paths in [('csv', csv_paths), ('parquet', parquet_paths)]:
+            size_mb = sum(path.stat().st_size for path in paths) / 1024 / 1024
+            runs = [run_cold(paths, store_format) for _ in range(args.repeats)]
+            best = min(runs, key=lambda r: r['load_seconds'])
+            print(f'{store_format:>8}: {best["load_seconds"]:.3f}s load, '
+                  f'{best["rss_mb"]:.1f} MB resident, '
+                  f'{best["frames_mb"]:.1f} MB in frames, '
+                  f'{size_mb:.1f} MB on disk')
+
+
+if __name__ == '__main__':
+    main()
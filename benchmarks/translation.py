@@ -0,0 +1,74 @@
+"""Compares translating the NLU examples one by one with batched, deduplicated and concurrent translation.
+
+A local stand-in translator with a fixed latency per request replaces the network, so the numbers only reflect the
+number of requests and how many of them overlap.
+
+Usage: python -m benchmarks.translation [--latency 0.2] [--languages es fr ru] [--batch-size 32] [--workers 8]
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+from typing import List, Text
+
+from components.masking import NLU_PATH, nlu_examples, read_nlu
+from components.translators import CachedTranslator, DEFAULT_BATCH_SIZE, DEFAULT_MAX_WORKERS
+
+
+class StandInTranslator:
+    """Waits for the latency on every request, like a round trip to a translation API."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.requests = 0
+
+    def translate(self, text: Text, src: Text, dest: Text) -> Text:
+        self.requests += 1
+        time.sleep(self.latency)
+        return f'[{src}->{dest}] {text}'
+
+    def translate_batch(self, texts: List[Text], src: Text, dest: Text) -> List[Text]:
+        self.requests += 1
+        time.sleep(self.latency)
+        return [f'[{src}->{dest}] {text}' for text in texts]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--nlu', type=Path, default=NLU_PATH)
+    parser.add_argument('--latency', type=float, default=0.2, help='seconds per request')
+    parser.add_argument('--languages', nargs='+', default=['es', 'fr', 'ru'], help='source languages of the examples')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--workers', type=int, default=DEFAULT_MAX_WORKERS)
+    args = parser.parse_args()
+
+    # the NLU examples, each pretending to be written in every source language
+    texts = nlu_examples(read_nlu(args.nlu))
+    requests = [(text, src, 'en') for src in args.languages for text in texts]
+    print(f'{len(requests)} messages, {len(set(requests))} distinct')
+
+    # the previous behaviour: one request per message
+    backend = StandInTranslator(args.latency)
+    start = time.perf_counter()
+    for text, src, dest in requests:
+        backend.translate(text, src, dest)
+    sequential = time.perf_counter() - start
+    print(f'one by one:  {sequential:8.2f}s, {backend.requests} requests')
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        backend = StandInTranslator(args.latency)
+        translator = CachedTranslator(backend, path=Path(tmp_dir).joinpath('translations.sqlite3'))
+
+        start = time.perf_counter()
+        translator.translate_many(requests, batch_size=args.batch_size, max_workers=args.workers)
+        batched = time.perf_counter() - start
+        print(f'batched:     {batched:8.2f}s, {backend.requests} requests ({sequential / batched:.0f}x faster)')
+
+        start = time.perf_counter()
+        translator.translate_many(requests, batch_size=args.batch_size, max_workers=args.workers)
+        cached = time.perf_counter() - start
+        print(f'cached:      {cached:8.2f}s, {backend.requests} requests in total')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,20 @@
+import logging
+from typing import Any, Text, Dict, Optional
+
+from rasa.core.channels import rest
+from sanic.request import Request
+
+logger = logging.getLogger(__name__)
+
+
+class RestInput(rest.RestInput):
+    """The REST channel, which also passes the sender ID to the NLU pipeline as message metadata.
+
+    Rasa does not give NLU components access to the conversation a message belongs to, so the components keeping
+    per-conversation state read it from the metadata instead. The channel keeps the name and webhook of the REST one.
+    """
+
+    def get_metadata(self, request: Request) -> Optional[Dict[Text, Any]]:
+        payload = request.json or {}
+        metadata = payload.get('metadata') or {}
+        return {**metadata, 'sender_id': payload.get('sender')}
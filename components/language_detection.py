@@ -1,6 +1,9 @@
 import logging
-from collections import defaultdict
-from typing import Any, Text, Dict, List
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Text, Dict, List, Tuple, Optional
 from rasa.engine.graph import GraphComponent, ExecutionContext
 from rasa.engine.recipes.default_recipe import DefaultV1Recipe
 from rasa.engine.storage.resource import Resource
@@ -12,6 +15,70 @@ from rasa.shared.nlu.training_data.training_data import TrainingData
 
 logger = logging.getLogger(__name__)
 
+# fastText models by path, shared by all the components of the process
+_models: Dict[Text, Any] = {}
+_models_lock = threading.Lock()
+
+# messages without a sender ID in their metadata, e.g. training examples, share the state of a single conversation
+SHARED_CONVERSATION = ''
+
+
+def load_model(model_file: Text) -> Any:
+    """Loads every model once per process, retraining or reloading the pipeline reuses it.
+
+    A model loaded before the workers are forked is shared by them, since its weights are never written to.
+    """
+    model_file = os.path.abspath(model_file)
+    with _models_lock:
+        model = _models.get(model_file)
+        if model is None:
+            logger.info(f'Loading language identification model from {model_file}')
+            model = _models[model_file] = fasttext.load_model(model_file)
+
+    return model
+
+
+class LanguageHistory:
+    """Languages confidently detected in recent conversations, the least recently active ones are forgotten first.
+
+    Every detection multiplies the counts of the conversation by the decay before adding one to its language, so the
+    latest messages weigh the most. The most likely language is kept up to date, looking it up takes constant time.
+    """
+
+    def __init__(self, max_conversations: int = 10000, decay: float = 0.8, min_count: float = 0.01):
+        self.max_conversations = max_conversations
+        self.decay = decay
+        self.min_count = min_count
+
+        self._lock = threading.Lock()
+        # conversation -> (language -> decayed count, most likely language)
+        self._conversations: 'OrderedDict[Text, Tuple[Dict[Text, float], Text]]' = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._conversations)
+
+    def observe(self, conversation_id: Text, lang: Text):
+        with self._lock:
+            counts, _ = self._conversations.pop(conversation_id, ({}, lang))
+            # languages not seen for a while decay below the minimum and are dropped
+            counts = {
+                other: count * self.decay for other, count in counts.items() if count * self.decay >= self.min_count
+            }
+            counts[lang] = counts.get(lang, 0.0) + 1
+
+            self._conversations[conversation_id] = counts, max(counts, key=counts.get)
+            while len(self._conversations) > self.max_conversations:
+                self._conversations.popitem(last=False)
+
+    def most_likely(self, conversation_id: Text) -> Optional[Text]:
+        with self._lock:
+            state = self._conversations.get(conversation_id)
+            if state is None:
+                return None
+
+            self._conversations.move_to_end(conversation_id)
+            return state[1]
+
 
 @DefaultV1Recipe.register(component_types=DefaultV1Recipe.ComponentType.MESSAGE_FEATURIZER, is_trainable=False)
 class LanguageDetector(GraphComponent):
@@ -19,10 +86,18 @@ class LanguageDetector(GraphComponent):
 
     def __init__(self, config: Dict[Text, Any]):
         logger.info(f'{self.name} initialized.')
-        self.model = fasttext.load_model(config['model_file'])
+        model_file = config['model_file']
+        if config.get('quantized', False):
+            # the compressed variant of the same model, e.g. lid.176.ftz next to lid.176.bin
+            model_file = str(Path(model_file).with_suffix('.ftz'))
+
+        self.model = load_model(model_file)
         self.confidence_threshold = config.get('confidence_threshold', 0.9)
         self.default = config.get('default', 'en')
-        self.past_predictions = defaultdict(int)  # a bit of a hack, but will work for demo
+        self.history = LanguageHistory(
+            max_conversations=config.get('max_conversations', 10000),
+            decay=config.get('decay', 0.8),
+        )
 
     @staticmethod
     def required_packages() -> List[Text]:
@@ -38,30 +113,51 @@ class LanguageDetector(GraphComponent):
     ) -> GraphComponent:
         return cls(config)
 
+    def predict(self, texts: List[Text]) -> List[Tuple[Text, float]]:
+        """Top language and its confidence for every text, predicted in a single call to the model."""
+        # fastText predicts line by line, so every text has to be a single line
+        lines = [' '.join(text.splitlines()) for text in texts]
+
+        try:
+            labels, confidences = self.model.predict(lines, k=1)
+        except Exception as e:
+            logger.warning('Failed to determine the language of a batch of messages, predicting one by one', exc_info=e)
+            return [self._predict_one(line) for line in lines]
+
+        return [
+            (label[0].split('__')[-1], float(confidence[0])) if len(label) else (self.default, 0.0)
+            for label, confidence in zip(labels, confidences)
+        ]
+
+    def _predict_one(self, text: Text) -> Tuple[Text, float]:
+        try:
+            labels, confidences = self.model.predict(text, k=1)
+            return labels[0].split('__')[-1], float(confidences[0])
+        except Exception as e:
+            logger.warning(f'Failed to determine the language of the message: {text}', exc_info=e)
+            return self.default, 0.0
+
     def process(self, messages: List[Message]) -> List[Message]:
-        for message in messages:
-            text = message.get('text', '')
+        texts = [message.get('text', '') or '' for message in messages]
+        non_empty = [i for i, text in enumerate(texts) if len(text)]
+        predictions = dict(zip(non_empty, self.predict([texts[i] for i in non_empty])))
 
-            if not len(text):
+        # messages are still resolved in order, since low confidence predictions fall back to the earlier ones
+        for i, message in enumerate(messages):
+            if i not in predictions:
                 message.set('language', self.default)
                 continue
 
-            try:
-                predictions = self.model.predict(text, k=1)  # Predict top language
-                lang = predictions[0][0].split('__')[-1]  # Extract language code
-                confidence = predictions[1][0]
-                logger.info(f'Detected language: {lang} ({confidence:.2f})')
-            except Exception as e:
-                logger.warning(f'Failed to determine the language of the message: {text}', exc_info=e)
-                lang = self.default
-                confidence = 0.0
+            lang, confidence = predictions[i]
+            logger.info(f'Detected language: {lang} ({confidence:.2f})')
+
+            metadata = message.get('metadata') or {}
+            conversation_id = metadata.get('sender_id') or SHARED_CONVERSATION
 
             if confidence > self.confidence_threshold:
-                self.past_predictions[lang] += 1
-            elif len(self.past_predictions):
-                lang = max(self.past_predictions, key=self.past_predictions.get)
+                self.history.observe(conversation_id, lang)
             else:
-                lang = self.default
+                lang = self.history.most_likely(conversation_id) or self.default
 
             message.set('language', lang, add_to_output=True)
 
@@ -0,0 +1,177 @@
+import logging
+import re
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Text, Tuple
+
+from ruamel.yaml import YAML
+
+logger = logging.getLogger(__name__)
+
+NLU_PATH = Path('data/nlu.yml')
+
+# [text](entity) or [text]{"entity": ...} annotations in the examples
+ENTITY_ANNOTATION = re.compile(r'\[([^\]]*)\](\([^)]*\)|\{[^}]*\})')
+
+# placeholders survive translation as they are, translators may add spaces around the number though
+PLACEHOLDER = '__{}__'
+PLACEHOLDER_PATTERN = re.compile(r'__\s*(\d+)\s*__')
+WORD = re.compile(r'[^\W\d_]+')
+# language of the training examples
+VOCABULARY_LANGUAGE = 'en'
+
+
+def read_nlu(nlu_path: Path = NLU_PATH) -> Dict:
+    return YAML(typ='safe').load(nlu_path.read_text(encoding='utf-8'))
+
+
+def nlu_examples(nlu: Dict) -> List[Text]:
+    """Training examples without their entity annotations."""
+    examples = []
+
+    for item in nlu.get('nlu', []):
+        for line in str(item.get('examples', '')).splitlines():
+            text = ENTITY_ANNOTATION.sub(r'\1', line.strip().lstrip('- ').strip())
+            if len(text):
+                examples.append(text)
+
+    return examples
+
+
+def lookup_terms(nlu: Dict) -> List[Text]:
+    """Terms of all the lookup tables, e.g. countries and commodities."""
+    return [str(term) for terms in (nlu.get('lookup') or {}).values() for term in terms or []]
+
+
+def _lower(text: Text) -> Text:
+    # character by character, so positions in the result are positions in the text
+    return ''.join(char.lower() if len(char.lower()) == 1 else char for char in text)
+
+
+class TermMatcher:
+    """Finds whole-word occurrences of a fixed set of terms in one pass over the text, ignoring case.
+
+    An Aho-Corasick automaton: a trie of the terms, where every node also links to the longest suffix of its path that
+    is a prefix of some term, so matching never moves back in the text.
+    """
+
+    def __init__(self, terms: Iterable[Text]):
+        self._goto: List[Dict[Text, int]] = [{}]
+        self._fail: List[int] = [0]
+        # lengths of the terms ending at every node
+        self._lengths: List[List[int]] = [[]]
+
+        for term in dict.fromkeys(_lower(term.strip()) for term in terms):
+            if len(term):
+                self._insert(term)
+
+        # breadth-first, so the failure links of shorter paths are known first, the children of the root link to it
+        queue = list(self._goto[0].values())
+        for node in queue:
+            for char, child in self._goto[node].items():
+                queue.append(child)
+
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+
+                self._fail[child] = self._goto[fallback].get(char, 0)
+                self._lengths[child] = self._lengths[child] + self._lengths[self._fail[child]]
+
+    def _insert(self, term: Text):
+        node = 0
+        for char in term:
+            if char not in self._goto[node]:
+                self._goto.append({})
+                self._fail.append(0)
+                self._lengths.append([])
+                self._goto[node][char] = len(self._goto) - 1
+
+            node = self._goto[node][char]
+
+        self._lengths[node].append(len(term))
+
+    def find(self, text: Text) -> List[Tuple[int, int]]:
+        """Non-overlapping (start, end) spans of the terms, the longest one wins among those starting first."""
+        lowered = _lower(text)
+        spans = []
+
+        node = 0
+        for i, char in enumerate(lowered):
+            while node and char not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(char, 0)
+
+            for length in self._lengths[node]:
+                start, end = i + 1 - length, i + 1
+                # only whole words, "oil" is not a term within "boil"
+                if (start == 0 or not lowered[start - 1].isalnum()) and (end == len(text) or not lowered[end].isalnum()):
+                    spans.append((start, end))
+
+        selected = []
+        for start, end in sorted(spans, key=lambda span: (span[0], -span[1])):
+            if not len(selected) or start >= selected[-1][1]:
+                selected.append((start, end))
+
+        return selected
+
+
+class TermMasker:
+    """Replaces lookup-table terms with placeholders before translation and puts them back afterwards.
+
+    Names of countries and commodities are recognized by the NLU pipeline as they are, so they are neither sent to
+    the translator nor at risk of being translated into something else. Messages with nothing left to translate, or
+    only with words of the training examples when translating into their language, are not translated at all.
+    """
+
+    def __init__(self, terms: Iterable[Text], vocabulary: Iterable[Text] = ()):
+        self.matcher = TermMatcher(terms)
+        self.vocabulary: Set[Text] = {word.lower() for word in vocabulary}
+
+    @classmethod
+    def from_nlu(cls, nlu_path: Path = NLU_PATH) -> 'TermMasker':
+        if not nlu_path.exists():
+            logger.warning(f'{nlu_path} not found, terms are translated together with the messages')
+            return cls([])
+
+        nlu = read_nlu(nlu_path)
+        vocabulary = [word for example in nlu_examples(nlu) for word in WORD.findall(example)]
+        return cls(lookup_terms(nlu), vocabulary)
+
+    def mask(self, text: Text) -> Tuple[Text, List[Text]]:
+        """The text with its terms replaced by numbered placeholders, and the terms."""
+        parts = []
+        terms = []
+        position = 0
+        for start, end in self.matcher.find(text):
+            parts.append(text[position:start])
+            parts.append(PLACEHOLDER.format(len(terms)))
+            terms.append(text[start:end])
+            position = end
+
+        parts.append(text[position:])
+        return ''.join(parts), terms
+
+    def unmask(self, text: Text, terms: List[Text]) -> Optional[Text]:
+        """The translated text with its terms restored, None if the translator lost any of the placeholders."""
+        restored = set()
+
+        def restore(match: re.Match) -> Text:
+            i = int(match.group(1))
+            if i >= len(terms):
+                return match.group(0)
+
+            restored.add(i)
+            return terms[i]
+
+        text = PLACEHOLDER_PATTERN.sub(restore, text)
+        if len(restored) < len(terms):
+            return None
+
+        return text
+
+    def needs_translation(self, masked: Text, dest_lang: Text) -> bool:
+        words = WORD.findall(PLACEHOLDER_PATTERN.sub(' ', masked))
+        if dest_lang != VOCABULARY_LANGUAGE:
+            return len(words) > 0
+
+        return any(word.lower() not in self.vocabulary for word in words)
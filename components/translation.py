@@ -1,6 +1,6 @@
 import logging
-from typing import Any, Text, Dict, List
-from googletrans import Translator
+from pathlib import Path
+from typing import Any, Text, Dict, List, Tuple
 from rasa.engine.graph import GraphComponent, ExecutionContext
 from rasa.engine.recipes.default_recipe import DefaultV1Recipe
 from rasa.engine.storage.resource import Resource
@@ -8,6 +8,12 @@ from rasa.engine.storage.storage import ModelStorage
 from rasa.shared.nlu.training_data.message import Message
 from rasa.shared.nlu.training_data.training_data import TrainingData
 
+from components.masking import TermMasker, NLU_PATH
+from components.translators import (
+    CachedTranslator, load_backend, TRANSLATIONS_DB, DEFAULT_MEMORY_SIZE, DEFAULT_BATCH_SIZE, DEFAULT_MAX_WORKERS,
+    DEFAULT_RETRIES
+)
+
 logger = logging.getLogger(__name__)
 
 
@@ -34,7 +40,21 @@ class TranslationComponent(GraphComponent):
         if self.src_lang == self.dest_lang == 'auto':
             raise ValueError('At least one of src_lang and dest_lang must be specified!')
 
-        self.translator = Translator()
+        # translations are looked up in the local cache before the backend is called
+        self.translator = CachedTranslator(
+            load_backend(config.get('translator', 'google')),
+            path=Path(config.get('cache_path', TRANSLATIONS_DB)),
+            memory_size=config.get('cache_size', DEFAULT_MEMORY_SIZE),
+        )
+        self.batch_size = config.get('batch_size', DEFAULT_BATCH_SIZE)
+        self.max_workers = config.get('max_workers', DEFAULT_MAX_WORKERS)
+        self.retries = config.get('retries', DEFAULT_RETRIES)
+
+        # countries and commodities from the lookup tables are kept out of the translated texts
+        if config.get('mask_terms', True):
+            self.masker = TermMasker.from_nlu(Path(config.get('nlu_path', NLU_PATH)))
+        else:
+            self.masker = TermMasker([])
 
         logger.info(f'{self.name} {self.type}: {self.src_lang} -> {self.dest_lang} initialized.')
 
@@ -53,6 +73,8 @@ class TranslationComponent(GraphComponent):
         return cls(config)
 
     def process(self, messages: List[Message]) -> List[Message]:
+        # (message, text, masked text, masked terms, src, dest) of every message to translate
+        pending = []
         for message in messages:
             text = get_nested_value(message, self.type, '')
 
@@ -68,14 +90,45 @@ class TranslationComponent(GraphComponent):
             if dest_lang == 'auto':
                 dest_lang = message.get('language', 'auto')  # Assume language is already detected
 
-            if src_lang != dest_lang:
-                translated = self.translator.translate(text, src=src_lang, dest=dest_lang)
+            if src_lang == dest_lang:
+                continue
+
+            masked, terms = self.masker.mask(text)
+            if not self.masker.needs_translation(masked, dest_lang):
+                logger.info(f'Nothing to translate in {self.type} "{text}" ({src_lang})')
+                continue
+
+            pending.append((message, text, masked, terms, src_lang, dest_lang))
 
-                logger.info(f'Translated {self.type} from "{text}" ({src_lang}) to "{translated.text}" ({dest_lang})')
-                message.set(self.type, translated.text)
+        translations = self.translate_many([(masked, src, dest) for _, _, masked, _, src, dest in pending])
+
+        # texts whose placeholders did not survive the translation are translated again as they are
+        restored = {}
+        for _, text, masked, terms, src_lang, dest_lang in pending:
+            restored[text, src_lang, dest_lang] = self.masker.unmask(translations[masked, src_lang, dest_lang], terms)
+
+        lost = [key for key, translated in restored.items() if translated is None]
+        if len(lost):
+            logger.warning(f'Translator lost the masked terms of {len(lost)} texts, translating them unmasked')
+            restored.update(self.translate_many(lost))
+
+        for message, text, _, _, src_lang, dest_lang in pending:
+            translated = restored[text, src_lang, dest_lang]
+
+            logger.info(f'Translated {self.type} from "{text}" ({src_lang}) to "{translated}" ({dest_lang})')
+            message.set(self.type, translated)
 
         return messages
 
+    def translate_many(self, requests: List[Tuple[Text, Text, Text]]) -> Dict[Tuple[Text, Text, Text], Text]:
+        # identical texts are translated once, batches of different language pairs at the same time
+        return self.translator.translate_many(
+            requests,
+            batch_size=self.batch_size,
+            max_workers=self.max_workers,
+            retries=self.retries,
+        )
+
     def process_training_data(self, training_data: TrainingData) -> TrainingData:
         self.process(training_data.training_examples)
         return training_data
@@ -0,0 +1,229 @@
+import importlib
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Text, Tuple
+
+logger = logging.getLogger(__name__)
+
+TRANSLATIONS_DB = Path('translations.sqlite3')
+DEFAULT_MEMORY_SIZE = 4096
+
+# texts sent to the backend at once, requests running at the same time and attempts of every request
+DEFAULT_BATCH_SIZE = 32
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 1.0
+
+
+class GoogleTranslator:
+    """Translates with the Google Translate web API, every call is a network round trip."""
+
+    def __init__(self):
+        # imported here, so the cache and the other backends can be used without it
+        from googletrans import Translator
+
+        self.translator = Translator()
+
+    def translate(self, text: Text, src: Text, dest: Text) -> Text:
+        return self.translator.translate(text, src=src, dest=dest).text
+
+    def translate_batch(self, texts: List[Text], src: Text, dest: Text) -> List[Text]:
+        return [translated.text for translated in self.translator.translate(texts, src=src, dest=dest)]
+
+
+# backends by name, any other name is the import path of a class with the same `translate` method,
+# `translate_batch` is optional
+BACKENDS = {
+    'google': GoogleTranslator,
+}
+
+
+def load_backend(name: Text) -> Any:
+    if name in BACKENDS:
+        return BACKENDS[name]()
+
+    module_name, _, class_name = name.rpartition('.')
+    return getattr(importlib.import_module(module_name), class_name)()
+
+
+class CachedTranslator:
+    """Translations keyed by (text, src, dest), kept in SQLite with an in-memory LRU in front of it.
+
+    Only translations missing from both are requested from the backend. The database is shared by all the processes
+    using the same path, so a phrase is translated once for all of them and survives restarts.
+    """
+
+    def __init__(self, backend: Any, path: Path = TRANSLATIONS_DB, memory_size: int = DEFAULT_MEMORY_SIZE):
+        self.backend = backend
+        self.path = path
+        self.memory_size = memory_size
+
+        self._lock = threading.Lock()
+        self._memory: 'OrderedDict[Tuple[Text, Text, Text], Text]' = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+        self._connection = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+        with self._lock:
+            # concurrent readers do not block the writer of another process
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS translations ('
+                'text TEXT NOT NULL, src TEXT NOT NULL, dest TEXT NOT NULL, translation TEXT NOT NULL, '
+                'PRIMARY KEY (text, src, dest))'
+            )
+
+    def cached(self, text: Text, src: Text, dest: Text) -> Optional[Text]:
+        key = (text, src, dest)
+        with self._lock:
+            translation = self._memory.get(key)
+            if translation is not None:
+                self._memory.move_to_end(key)
+                return translation
+
+            row = self._connection.execute(
+                'SELECT translation FROM translations WHERE text = ? AND src = ? AND dest = ?', key
+            ).fetchone()
+            if row is None:
+                return None
+
+            self._remember(key, row[0])
+            return row[0]
+
+    def store(self, text: Text, src: Text, dest: Text, translation: Text):
+        key = (text, src, dest)
+        with self._lock:
+            self._connection.execute('INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?)', (*key, translation))
+            self._remember(key, translation)
+
+    def store_many(self, translations: Dict[Tuple[Text, Text, Text], Text]):
+        with self._lock:
+            # a single transaction, instead of one per row
+            with self._connection:
+                self._connection.execute('BEGIN')
+                self._connection.executemany('INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?)',
+                                             [(*key, translation) for key, translation in translations.items()])
+
+            for key, translation in translations.items():
+                self._remember(key, translation)
+
+    def translate(self, text: Text, src: Text, dest: Text) -> Text:
+        translation = self.cached(text, src, dest)
+        with self._lock:
+            if translation is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if translation is not None:
+            return translation
+
+        translation = self.backend.translate(text, src, dest)
+        self.store(text, src, dest, translation)
+        return translation
+
+    def translate_many(
+            self,
+            requests: Iterable[Tuple[Text, Text, Text]],
+            batch_size: int = DEFAULT_BATCH_SIZE,
+            max_workers: int = DEFAULT_MAX_WORKERS,
+            retries: int = DEFAULT_RETRIES,
+            backoff: float = DEFAULT_BACKOFF,
+    ) -> Dict[Tuple[Text, Text, Text], Text]:
+        """Translations of (text, src, dest) requests, each distinct one is translated at most once.
+
+        Requests missing from the cache are grouped by language pair and sent to the backend in batches, several
+        batches at a time. A failed batch is retried with exponential backoff. The batches that succeeded are cached
+        before the last failure is raised, so a rerun only requests the failed ones.
+        """
+        translations = {}
+        # (src, dest) -> texts missing from the cache
+        missing: Dict[Tuple[Text, Text], List[Text]] = {}
+
+        for key in dict.fromkeys(requests):
+            text, src, dest = key
+            translation = self.cached(text, src, dest)
+            if translation is not None:
+                translations[key] = translation
+            else:
+                missing.setdefault((src, dest), []).append(text)
+
+        with self._lock:
+            self.hits += len(translations)
+            self.misses += sum(len(texts) for texts in missing.values())
+
+        batches = [
+            (texts[start:start + batch_size], src, dest)
+            for (src, dest), texts in missing.items()
+            for start in range(0, len(texts), batch_size)
+        ]
+
+        def translate_batch(batch: Tuple[List[Text], Text, Text]) -> List[Text]:
+            return self._with_retries(lambda: self._translate_batch(*batch), retries, backoff)
+
+        translated = {}
+        error = None
+
+        def collect(batch: Tuple[List[Text], Text, Text], batch_translations: List[Text]):
+            texts, src, dest = batch
+            translated.update(((text, src, dest), translation) for text, translation in zip(texts, batch_translations))
+
+        if len(batches) > 1:
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                futures = {pool.submit(translate_batch, batch): batch for batch in batches}
+                for future in as_completed(futures):
+                    try:
+                        collect(futures[future], future.result())
+                    except Exception as e:
+                        error = e
+        else:
+            for batch in batches:
+                try:
+                    collect(batch, translate_batch(batch))
+                except Exception as e:
+                    error = e
+
+        if len(translated):
+            self.store_many(translated)
+
+        if error is not None:
+            raise error
+
+        translations.update(translated)
+        return translations
+
+    def _translate_batch(self, texts: List[Text], src: Text, dest: Text) -> List[Text]:
+        if hasattr(self.backend, 'translate_batch'):
+            return self.backend.translate_batch(texts, src, dest)
+
+        return [self.backend.translate(text, src, dest) for text in texts]
+
+    @staticmethod
+    def _with_retries(call, retries: int, backoff: float):
+        # at least one attempt, whatever the configuration says
+        attempts = max(retries, 1)
+        for attempt in range(attempts):
+            try:
+                return call()
+            except Exception as e:
+                if attempt == attempts - 1:
+                    raise
+
+                delay = backoff * 2 ** attempt
+                logger.warning(f'Translation failed, retrying in {delay:.1f}s', exc_info=e)
+                time.sleep(delay)
+
+    def stats(self) -> Dict[Text, int]:
+        return {'hits': self.hits, 'misses': self.misses, 'memory_entries': len(self._memory)}
+
+    def _remember(self, key: Tuple[Text, Text, Text], translation: Text):
+        self._memory[key] = translation
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
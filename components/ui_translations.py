@@ -0,0 +1,186 @@
+import argparse
+import csv
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Text, Tuple
+
+logger = logging.getLogger(__name__)
+
+TRANSLATIONS_FILE = Path('translations_cache.csv')
+# translations of the interface and the responses of the bot prepared in advance, see `build_catalog`
+CATALOG_FILE = Path('translations_catalog.csv')
+DOMAIN_PATH = Path('domain.yml')
+COLUMNS = ['text', 'language', 'translation']
+
+# languages of the interface, the first one is the language everything is written in
+LANGUAGES = {
+    'English': 'en',
+    'Spanish': 'es',
+    'French': 'fr',
+    'German': 'de',
+    'Chinese': 'zh-cn',
+    'Japanese': 'ja',
+    'Russian': 'ru',
+    'Hindi': 'hi',
+    'Persian': 'fa'
+}
+SOURCE_LANGUAGE = 'en'
+
+# every fixed string of the streamlit application that is translated
+UI_STRINGS = [
+    'Settings',
+    'Select Language',
+    'Clear Conversation',
+    'Type your message:',
+    'Getting response from chatbot...',
+    'Failed to get response from the bot.',
+]
+
+
+def read_translations(path: Path) -> Tuple[Dict[Tuple[Text, Text], Text], int, bool]:
+    """Translations by (text, language) with the last row of every key winning, the number of rows and whether
+    the file had the expected header."""
+    translations = {}
+    rows = 0
+    if not path.exists():
+        return translations, rows, False
+
+    with open(path, 'r', newline='', encoding='utf-8') as file:
+        reader = csv.reader(file)
+        header = next(reader, None)
+        for row in reader:
+            rows += 1
+            # a row cut short by a crash while appending
+            if len(row) != len(COLUMNS):
+                continue
+
+            text, language, translation = row
+            translations[text, language] = translation
+
+    return translations, rows, header == COLUMNS
+
+
+def write_translations(path: Path, translations: Dict[Tuple[Text, Text], Text]):
+    tmp_path = path.with_name(f'.{path.name}.{os.getpid()}.tmp')
+    try:
+        with open(tmp_path, 'w', newline='', encoding='utf-8') as file:
+            writer = csv.writer(file)
+            writer.writerow(COLUMNS)
+            writer.writerows([text, language, translation] for (text, language), translation in translations.items())
+
+        os.replace(tmp_path, path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
+class TranslationsFile:
+    """Translations of the interface keyed by (text, language), kept in a dict and persisted to an append-only CSV.
+
+    Every new translation appends a single row, so concurrent sessions never rewrite the file. Rows appended for the
+    same key by several processes are deduplicated when the file is compacted, once per process at startup.
+    """
+
+    def __init__(self, path: Path = TRANSLATIONS_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._translations: Dict[Tuple[Text, Text], Text] = {}
+
+        self.compact()
+
+    def __len__(self) -> int:
+        return len(self._translations)
+
+    def get(self, text: Text, language: Text) -> Optional[Text]:
+        return self._translations.get((text, language))
+
+    def add(self, text: Text, language: Text, translation: Text):
+        with self._lock:
+            self._translations[text, language] = translation
+
+            new_file = not self.path.exists()
+            with open(self.path, 'a', newline='', encoding='utf-8') as file:
+                writer = csv.writer(file)
+                if new_file:
+                    writer.writerow(COLUMNS)
+                writer.writerow([text, language, translation])
+
+    def compact(self):
+        """Reads the file and rewrites it if it had duplicate or broken rows."""
+        with self._lock:
+            translations, rows, has_header = read_translations(self.path)
+            self._translations = translations
+            if not self.path.exists() or (has_header and rows == len(translations)):
+                return
+
+            write_translations(self.path, translations)
+            logger.info(f'Compacted {self.path} from {rows} to {len(translations)} translations')
+
+
+def domain_responses(domain_path: Path = DOMAIN_PATH) -> List[Text]:
+    from ruamel.yaml import YAML
+
+    domain = YAML(typ='safe').load(domain_path.read_text(encoding='utf-8'))
+    return [
+        response['text']
+        for variations in (domain.get('responses') or {}).values()
+        for response in variations
+        if 'text' in response
+    ]
+
+
+def read_catalog(path: Path = CATALOG_FILE) -> Dict[Tuple[Text, Text], Text]:
+    translations, _, _ = read_translations(path)
+    return translations
+
+
+def build_catalog(
+        catalog_path: Path = CATALOG_FILE,
+        domain_path: Path = DOMAIN_PATH,
+        seed_path: Path = TRANSLATIONS_FILE,
+        translator: Optional[Text] = 'google',
+) -> List[Tuple[Text, Text]]:
+    """Translates the interface and the responses of the bot into every language and returns what is still missing.
+
+    Translations already in the catalog or in the translations cache of the application are reused, the rest is
+    requested from the translator, unless it is None.
+    """
+    texts = list(dict.fromkeys([*UI_STRINGS, *domain_responses(domain_path)]))
+    languages = [language for language in LANGUAGES.values() if language != SOURCE_LANGUAGE]
+
+    known = {**read_translations(seed_path)[0], **read_catalog(catalog_path)}
+    catalog = {}
+    missing = []
+    for language in languages:
+        for text in texts:
+            if (text, language) in known:
+                catalog[text, language] = known[text, language]
+            else:
+                missing.append((text, language))
+
+    if len(missing) and translator is not None:
+        from components.translators import CachedTranslator, load_backend
+
+        translations = CachedTranslator(load_backend(translator)).translate_many(
+            [(text, SOURCE_LANGUAGE, language) for text, language in missing]
+        )
+        catalog.update(((text, language), translations[text, SOURCE_LANGUAGE, language]) for text, language in missing)
+        missing = []
+
+    write_translations(catalog_path, dict(sorted(catalog.items(), key=lambda item: (item[0][1], item[0][0]))))
+    return missing
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Translate the interface and the responses of the bot in advance')
+    parser.add_argument('--translator', default='google', help='translator backend, see components.translators')
+    parser.add_argument('--offline', action='store_true', help='only reuse translations that are already known')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    missing = build_catalog(translator=None if args.offline else args.translator)
+    if len(missing):
+        logger.warning(f'{len(missing)} translations are missing from the catalog, '
+                       f'they will be translated by the application on first use')
@@ -0,0 +1,303 @@
+import json
+import logging
+import os
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Iterable, Optional, Iterator
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+DATA_PATH = Path('datasets/data')
+# derived tables live in a subdirectory, so they are never mistaken for a country dataset
+META_DIR = 'meta'
+MANIFEST_FILE = 'manifest.json'
+COVERAGE_FILE = 'coverage.csv'
+COVERAGE_COLUMNS = ['country', 'commodity', 'pricetype', 'first_date', 'last_date', 'rows', 'markets']
+
+# typed columnar copy of every dataset, preferred over the CSV when available
+STORE_SUFFIX = '.parquet'
+CATEGORICAL_COLUMNS = ['commodity', 'unit', 'pricetype', 'market']
+
+# monthly national aggregates of every dataset, in their own directory for the same reason as the derived tables
+ROLLUPS_DIR = 'rollups'
+ROLLUP_KEYS = ['commodity', 'pricetype', 'date']
+ROLLUP_PRICE_COLUMNS = ['price', 'usdprice']
+
+# all countries in a single table for cross-country queries, with the columns the queries use
+CONSOLIDATED_FILE = f'prices{STORE_SUFFIX}'
+CONSOLIDATED_COLUMNS = ['country', 'date', 'commodity', 'pricetype', 'market', 'unit', 'currency', 'price', 'usdprice']
+
+
+@contextmanager
+def atomic_path(path: Path) -> Iterator[Path]:
+    """Yields a temporary path that replaces the target only once it was completely written."""
+    tmp_path = path.with_name(f'.{path.name}.{os.getpid()}.tmp')
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
+def country_name(dataset_id: str) -> str:
+    return dataset_id.replace('wfp-food-prices-for-', '')
+
+
+def list_countries(data_path: Path = DATA_PATH) -> List[str]:
+    # country names come from the file names alone, no dataset is opened
+    paths = [*data_path.glob('*.csv'), *data_path.glob(f'*{STORE_SUFFIX}')]
+    return sorted({path.stem for path in paths})
+
+
+def meta_path(data_path: Path = DATA_PATH) -> Path:
+    path = data_path.joinpath(META_DIR)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def dataset_path(country: str, data_path: Path = DATA_PATH) -> Path:
+    return data_path.joinpath(f'{country}.csv')
+
+
+def store_path(country: str, data_path: Path = DATA_PATH) -> Path:
+    return data_path.joinpath(f'{country}{STORE_SUFFIX}')
+
+
+def rollup_path(country: str, data_path: Path = DATA_PATH) -> Path:
+    path = data_path.joinpath(ROLLUPS_DIR)
+    path.mkdir(parents=True, exist_ok=True)
+    return path.joinpath(f'{country}{STORE_SUFFIX}')
+
+
+def dataset_version(country: str, data_path: Path = DATA_PATH) -> int:
+    # datasets are replaced atomically, so the modification time identifies a version of the contents
+    path = store_path(country, data_path)
+    if not path.exists():
+        path = dataset_path(country, data_path)
+
+    return path.stat().st_mtime_ns
+
+
+def rollup_version(country: str, data_path: Path = DATA_PATH) -> Optional[int]:
+    path = rollup_path(country, data_path)
+    if not path.exists():
+        path = path.with_suffix('.csv')
+        if not path.exists():
+            return None
+
+    return path.stat().st_mtime_ns
+
+
+def consolidated_version(data_path: Path = DATA_PATH) -> Optional[int]:
+    path = meta_path(data_path).joinpath(CONSOLIDATED_FILE)
+    if not path.exists():
+        return None
+
+    return path.stat().st_mtime_ns
+
+
+def to_typed(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.copy()
+    df['date'] = pd.to_datetime(df['date'])
+    df['price'] = df['price'].astype(float)
+    df['usdprice'] = df['usdprice'].astype(float)
+    for column in CATEGORICAL_COLUMNS:
+        df[column] = df[column].astype('category')
+
+    return df
+
+
+def write_dataset(df: pd.DataFrame, country: str, data_path: Path = DATA_PATH):
+    with atomic_path(dataset_path(country, data_path)) as path:
+        df.to_csv(path, index=False)
+
+    try:
+        with atomic_path(store_path(country, data_path)) as path:
+            to_typed(df).to_parquet(path, index=False)
+    except ImportError:
+        logger.warning(f'pyarrow is not installed, {country} is stored as CSV only')
+
+
+def read_dataset(country: str, data_path: Path = DATA_PATH, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    path = store_path(country, data_path)
+    if path.exists():
+        try:
+            return pd.read_parquet(path, columns=columns)
+        except ImportError:
+            logger.warning(f'pyarrow is not installed, falling back to CSV for {country}')
+
+    return pd.read_csv(dataset_path(country, data_path), usecols=columns)
+
+
+def read_manifest(data_path: Path = DATA_PATH) -> Dict[str, Dict]:
+    manifest_path = meta_path(data_path).joinpath(MANIFEST_FILE)
+    if not manifest_path.exists():
+        return {}
+
+    with open(manifest_path, 'r') as file:
+        return json.load(file)
+
+
+def write_manifest(manifest: Dict[str, Dict], data_path: Path = DATA_PATH):
+    with atomic_path(meta_path(data_path).joinpath(MANIFEST_FILE)) as path, open(path, 'w') as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+
+
+def manifest_entry(df: pd.DataFrame) -> Dict:
+    return {
+        'commodities': sorted(df.commodity.unique()),
+    }
+
+
+def build_manifest(countries: Iterable[str], data_path: Path = DATA_PATH) -> Dict[str, Dict]:
+    manifest = {}
+    for country in countries:
+        # only the commodity column is needed for the manifest
+        df = read_dataset(country, data_path, columns=['commodity'])
+        manifest[country] = manifest_entry(df)
+
+    return manifest
+
+
+def coverage_table(df: pd.DataFrame, country: str) -> pd.DataFrame:
+    dates = pd.to_datetime(df['date'])
+    coverage = (df.assign(date=dates)
+                .groupby(['commodity', 'pricetype'], observed=True)
+                .agg(first_date=('date', 'min'), last_date=('date', 'max'),
+                     rows=('date', 'size'), markets=('market', 'nunique'))
+                .reset_index())
+    coverage.insert(0, 'country', country)
+    return coverage[COVERAGE_COLUMNS]
+
+
+def read_coverage(data_path: Path = DATA_PATH) -> Optional[pd.DataFrame]:
+    coverage_path = meta_path(data_path).joinpath(COVERAGE_FILE)
+    if not coverage_path.exists():
+        return None
+
+    return pd.read_csv(coverage_path, parse_dates=['first_date', 'last_date'])
+
+
+def write_coverage(tables: Iterable[pd.DataFrame], data_path: Path = DATA_PATH):
+    tables = list(tables)
+    coverage = pd.concat(tables, ignore_index=True) if len(tables) else pd.DataFrame(columns=COVERAGE_COLUMNS)
+    with atomic_path(meta_path(data_path).joinpath(COVERAGE_FILE)) as path:
+        coverage.sort_values(['country', 'commodity', 'pricetype']).to_csv(path, index=False, date_format='%Y-%m-%d')
+
+
+def build_coverage(countries: Iterable[str], data_path: Path = DATA_PATH) -> List[pd.DataFrame]:
+    return [
+        coverage_table(read_dataset(country, data_path, columns=['date', 'commodity', 'pricetype', 'market']), country)
+        for country in countries
+    ]
+
+
+def monthly_rollup(df: pd.DataFrame) -> pd.DataFrame:
+    """Mean, median and quartiles of the market prices per commodity, pricetype and month, in both currencies.
+
+    Every price column also gets its year-over-year change: the ratio of the monthly mean to the mean of the same
+    month a year before, minus one.
+    """
+    df = df.assign(date=pd.to_datetime(df['date']), commodity=df['commodity'].astype(str),
+                   pricetype=df['pricetype'].astype(str))
+    grouped = df.groupby(['commodity', 'pricetype', pd.Grouper(key='date', freq='MS')])
+
+    columns = {}
+    for column in ROLLUP_PRICE_COLUMNS:
+        prices = grouped[column]
+        quartiles = prices.quantile([0.25, 0.75]).unstack()
+        columns[f'{column}_mean'] = prices.mean()
+        columns[f'{column}_median'] = prices.median()
+        columns[f'{column}_q25'] = quartiles[0.25]
+        columns[f'{column}_q75'] = quartiles[0.75]
+
+    columns['rows'] = grouped.size()
+    columns['currency'] = grouped['currency'].first()
+    rollup = pd.DataFrame(columns).reset_index()
+
+    means = [f'{column}_mean' for column in ROLLUP_PRICE_COLUMNS]
+    previous = rollup[[*ROLLUP_KEYS, *means]].assign(date=rollup['date'] + pd.DateOffset(years=1))
+    merged = rollup[ROLLUP_KEYS].merge(previous, on=ROLLUP_KEYS, how='left')
+    for column, mean in zip(ROLLUP_PRICE_COLUMNS, means):
+        rollup[f'{column}_yoy'] = rollup[mean].to_numpy() / merged[mean].to_numpy() - 1
+
+    return rollup
+
+
+def write_rollup(rollup: pd.DataFrame, country: str, data_path: Path = DATA_PATH):
+    path = rollup_path(country, data_path)
+    try:
+        with atomic_path(path) as tmp_path:
+            rollup.to_parquet(tmp_path, index=False)
+    except ImportError:
+        with atomic_path(path.with_suffix('.csv')) as tmp_path:
+            rollup.to_csv(tmp_path, index=False, date_format='%Y-%m-%d')
+
+
+def read_rollup(country: str, data_path: Path = DATA_PATH) -> Optional[pd.DataFrame]:
+    path = rollup_path(country, data_path)
+    if path.exists():
+        try:
+            return pd.read_parquet(path)
+        except ImportError:
+            logger.warning(f'pyarrow is not installed, falling back to CSV for {country} rollup')
+
+    path = path.with_suffix('.csv')
+    if not path.exists():
+        return None
+
+    return pd.read_csv(path, parse_dates=['date'])
+
+
+def build_rollups(countries: Iterable[str], data_path: Path = DATA_PATH):
+    for country in countries:
+        write_rollup(monthly_rollup(read_dataset(country, data_path)), country, data_path)
+
+
+def write_consolidated(countries: Iterable[str], data_path: Path = DATA_PATH):
+    """Writes the datasets of all countries as one table sorted by commodity, country and date."""
+    countries = sorted(countries)
+    frames = []
+    for country in countries:
+        df = to_typed(read_dataset(country, data_path, columns=CONSOLIDATED_COLUMNS[1:]))
+        frames.append(df.assign(country=country))
+
+    if not len(frames):
+        return
+
+    # categories are unified across the countries and kept sorted, so their codes order the same way as the values
+    consolidated = pd.concat(frames, ignore_index=True)[CONSOLIDATED_COLUMNS]
+    for column in ['country', *CATEGORICAL_COLUMNS, 'currency']:
+        if column in consolidated:
+            consolidated[column] = consolidated[column].astype(str).astype('category')
+
+    consolidated = consolidated.sort_values(['commodity', 'country', 'date'], kind='stable', ignore_index=True)
+
+    try:
+        with atomic_path(meta_path(data_path).joinpath(CONSOLIDATED_FILE)) as path:
+            consolidated.to_parquet(path, index=False)
+    except ImportError:
+        logger.warning('pyarrow is not installed, cross-country queries will read the datasets of every country')
+
+
+def read_consolidated(data_path: Path = DATA_PATH) -> Optional[pd.DataFrame]:
+    path = meta_path(data_path).joinpath(CONSOLIDATED_FILE)
+    if not path.exists():
+        return None
+
+    try:
+        return pd.read_parquet(path)
+    except ImportError:
+        logger.warning('pyarrow is not installed, cross-country queries will read the datasets of every country')
+        return None
+
+
+if __name__ == '__main__':
+    # rebuild the derived tables and the rollups for an existing data directory without downloading anything
+    write_manifest(build_manifest(list_countries()))
+    write_coverage(build_coverage(list_countries()))
+    build_rollups(list_countries())
+    write_consolidated(list_countries())
@@ -1,14 +1,63 @@
+import argparse
+import hashlib
+import json
 import logging
+import multiprocessing
 import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from functools import lru_cache
 from pathlib import Path
+from typing import Dict, Tuple, List, Optional, Callable
 
 from hdx.api.configuration import Configuration
 from hdx.data.dataset import Dataset
+import numpy as np
 import pandas as pd
 
+from datasets.storage import (
+    DATA_PATH, country_name, manifest_entry, write_manifest, write_dataset, coverage_table, write_coverage,
+    read_manifest, build_manifest, build_coverage, list_countries, meta_path, atomic_path, read_coverage, dataset_path,
+    monthly_rollup, write_rollup, build_rollups, rollup_version, write_consolidated, consolidated_version
+)
+
 logger = logging.getLogger(__name__)
 
-DATA_PATH = Path('datasets/data')
+UNIT_ALIASES = ['packet', 'sack', 'package', 'course', 'head', 'bunch', 'box', 'bar', 'pcs', 'brush', 'loaf', 'pair']
+
+# units kept as they are, compared in lower case
+BASE_UNITS = {
+    'unit', 'libra', 'day', 'month', 'kg', 'g', 'mt', 'l', 'pound', 'cuartilla', 'gallon', 'marmite', 'kwh', 'cylinder',
+    *UNIT_ALIASES
+}
+
+# whole unit strings with their own conversion, compared in lower case
+NAMED_UNITS = {
+    'cubic meter': (1 / 1000, 'L'),
+    'dozen': (1 / 12, 'Unit'),
+}
+
+# unit -> (factor to multiply the prices by, canonical unit)
+UNIT_CONVERSIONS = {
+    'MT': (1 / 1000, 'KG'),
+    'G': (1000, 'KG'),
+    'Libra': (1 / 0.3289, 'KG'),
+    'Pound': (1 / 0.45359237, 'KG'),
+    'Cuartilla': (1 / 2.875575, 'KG'),
+    'ML': (1000, 'L'),
+    'Gallon': (1 / 3.78541, 'L'),
+    'Month': (1 / 30, 'Day'),
+    'Marmite': (1 / 2.445, 'KG'),
+    **{alias.capitalize(): (1, 'Unit') for alias in UNIT_ALIASES},
+}
+
+# HDX metadata and checksum of every processed source
+SOURCES_FILE = 'sources.json'
+# rows per unrecognized unit in every dataset
+UNITS_REPORT_FILE = 'unrecognized_units.json'
+
+# identifies a price, a row of a new download with the key of a stored row but another price is a revision of it
+ROW_KEY = ['date', 'market', 'commodity', 'pricetype', 'unit']
 
 DATASET_SOURCES = [
     'wfp-food-prices-for-afghanistan',
@@ -112,110 +161,315 @@ DATASET_SOURCES = [
     'wfp-food-prices-for-zimbabwe'
 ]
 
-# Initialize HDX configuration
-Configuration.create(hdx_site='prod', user_agent='hdx', hdx_read_only=True)
+_hdx_configured = False
+
+
+def configure_hdx():
+    global _hdx_configured
+
+    # Initialize HDX configuration
+    if not _hdx_configured:
+        Configuration.create(hdx_site='prod', user_agent='hdx', hdx_read_only=True)
+        _hdx_configured = True
+
+
+def file_checksum(file_path: str) -> str:
+    checksum = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            checksum.update(chunk)
+
+    return checksum.hexdigest()
 
 
-def load_dataset(dataset_id: str):
+def download_dataset(
+        dataset_id: str,
+        folder: str,
+        reader: Callable[[str], Dataset],
+        known_source: Optional[Dict] = None
+) -> Tuple[Dict, Optional[str]]:
+    """Downloads the dataset unless it did not change since it was recorded as the known source.
+
+    Returns the metadata of the source and the path to the downloaded file, which is None for unchanged datasets.
+    """
     # Fetch the dataset
-    dataset = Dataset.read_from_hdx(dataset_id)
+    dataset = reader(dataset_id)
 
     # Get the list of resources (files) in the dataset
     resources = dataset.get_resources()
 
     # Download the first resource (you may need to adjust this if there are multiple resources)
     resource = resources[0]
-    file_path = resource.download()[1]
-
-    # Load the dataset into a pandas DataFrame
-    df = pd.read_csv(file_path, dtype=object)
-    df = df[1:].reset_index(drop=True)  # remove the first description row
-
-    df.price = df.price.astype(float)
-    df.usdprice = df.usdprice.astype(float)
-
-    unit_alias = ['packet', 'sack', 'package', 'course', 'head', 'bunch', 'box', 'bar', 'pcs', 'brush', 'loaf', 'pair']
-
-    # normalize units
-    for unit_str in df.unit.unique():
-        if (unit_str.lower() in [
-                    'unit', 'libra', 'day', 'month', 'kg', 'g', 'mt', 'l', 'pound', 'cuartilla', 'gallon', 'marmite', 'kwh',
-                    'cylinder',
-                    *unit_alias
-                ]
-                or unit_str.lower().startswith('usd/')):
-            continue  # Day, KG, MT, L, Unit, etc
-
-        if unit_str.lower() == 'cubic meter':
-            df.loc[df.unit == unit_str, 'price'] /= 1000
-            df.loc[df.unit == unit_str, 'usdprice'] /= 1000
-            df.loc[df.unit == unit_str, 'unit'] = 'L'
-            continue
-
-        if unit_str.lower() == 'dozen':
-            df.loc[df.unit == unit_str, 'price'] /= 12
-            df.loc[df.unit == unit_str, 'usdprice'] /= 12
-            df.loc[df.unit == unit_str, 'unit'] = 'Unit'
-            continue
 
+    source = {
+        'last_modified': resource.get('last_modified'),
+        'size': resource.get('size'),
+    }
+    if (known_source is not None and source['last_modified'] is not None
+            and all(known_source.get(key) == value for key, value in source.items())):
+        return known_source, None
+
+    file_path = resource.download(folder)[1]
+
+    # metadata can change without any change of the contents
+    source['checksum'] = file_checksum(file_path)
+    if known_source is not None and known_source.get('checksum') == source['checksum']:
+        return source, None
+
+    return source, file_path
+
+
+@lru_cache(maxsize=None)
+def parse_unit(unit_str: str) -> Optional[Tuple[float, str]]:
+    """Factor to multiply the prices by and the canonical unit, None if the unit is not recognized."""
+    if unit_str.lower() in BASE_UNITS or unit_str.lower().startswith('usd/'):
+        factor, unit = 1.0, unit_str  # Day, KG, MT, L, Unit, etc
+    elif unit_str.lower() in NAMED_UNITS:
+        factor, unit = NAMED_UNITS[unit_str.lower()]
+    elif unit_str in UNIT_CONVERSIONS:
+        factor, unit = 1.0, unit_str  # ML
+    else:
+        # quantities like "50 KG"
         try:
             n, unit = unit_str.split()
-        except Exception:
-            logger.error('Unit not recognized: ' + unit_str)
-            continue
+            factor = 1 / float(n)
+        except ValueError:
+            return None
+
+    if unit in UNIT_CONVERSIONS:
+        conversion_factor, unit = UNIT_CONVERSIONS[unit]
+        factor *= conversion_factor
+
+    return factor, unit
 
-        n = float(n)
 
-        df.loc[df.unit == unit_str, 'price'] /= n
-        df.loc[df.unit == unit_str, 'usdprice'] /= n
-        df.loc[df.unit == unit_str, 'unit'] = unit
+def normalize_dataset(df: pd.DataFrame) -> pd.DataFrame:
+    df.price = df.price.astype(float)
+    df.usdprice = df.usdprice.astype(float)
 
-    df.loc[df.unit == 'MT', 'price'] /= 1000
-    df.loc[df.unit == 'MT', 'usdprice'] /= 1000
-    df.loc[df.unit == 'MT', 'unit'] = 'KG'
+    # every distinct unit is parsed once, then all rows are converted in a single pass
+    conversions = {}
+    for unit_str in df.unit.dropna().unique():
+        conversion = parse_unit(unit_str)
+        if conversion is None:
+            logger.error('Unit not recognized: ' + unit_str)
+            conversion = (1.0, unit_str)
+        conversions[unit_str] = conversion
 
-    df.loc[df.unit == 'G', 'price'] *= 1000
-    df.loc[df.unit == 'G', 'usdprice'] *= 1000
-    df.loc[df.unit == 'G', 'unit'] = 'KG'
+    factors = df.unit.map({unit_str: factor for unit_str, (factor, _) in conversions.items()}).fillna(1.0)
+    df.price *= factors
+    df.usdprice *= factors
+    df.unit = df.unit.map({unit_str: unit for unit_str, (_, unit) in conversions.items()})
 
-    df.loc[df.unit == 'Libra', 'price'] /= 0.3289
-    df.loc[df.unit == 'Libra', 'usdprice'] /= 0.3289
-    df.loc[df.unit == 'Libra', 'unit'] = 'KG'
+    return df
 
-    df.loc[df.unit == 'Pound', 'price'] /= 0.45359237
-    df.loc[df.unit == 'Pound', 'usdprice'] /= 0.45359237
-    df.loc[df.unit == 'Pound', 'unit'] = 'KG'
 
-    df.loc[df.unit == 'Cuartilla', 'price'] /= 2.875575
-    df.loc[df.unit == 'Cuartilla', 'usdprice'] /= 2.875575
-    df.loc[df.unit == 'Cuartilla', 'unit'] = 'KG'
+def unrecognized_units(df: pd.DataFrame) -> Dict[str, int]:
+    # of the raw rows, normalized units like "Tubers" of "5 Tubers" are not recognized on their own
+    return {
+        unit_str: int(count)
+        for unit_str, count in df.unit.value_counts().items()
+        if parse_unit(unit_str) is None
+    }
 
-    df.loc[df.unit == 'ML', 'price'] *= 1000
-    df.loc[df.unit == 'ML', 'usdprice'] *= 1000
-    df.loc[df.unit == 'ML', 'unit'] = 'L'
 
-    df.loc[df.unit == 'Gallon', 'price'] /= 3.78541
-    df.loc[df.unit == 'Gallon', 'usdprice'] /= 3.78541
-    df.loc[df.unit == 'Gallon', 'unit'] = 'L'
+def matching_rows(df: pd.DataFrame, other: pd.DataFrame, columns: List[str]) -> np.ndarray:
+    """Whether each row of df has a row with the same values of the columns in other."""
+    merged = df[columns].merge(other[columns].drop_duplicates(), on=columns, how='left', indicator=True)
+    return merged['_merge'].eq('both').to_numpy()
 
-    df.loc[df.unit == 'Month', 'price'] /= 30
-    df.loc[df.unit == 'Month', 'usdprice'] /= 30
-    df.loc[df.unit == 'Month', 'unit'] = 'Day'
 
-    df.loc[df.unit == 'Marmite', 'price'] /= 2.445
-    df.loc[df.unit == 'Marmite', 'usdprice'] /= 2.445
-    df.loc[df.unit == 'Marmite', 'unit'] = 'KG'
+def process_dataset(
+        dataset_id: str,
+        file_path: str,
+        data_path: Path = DATA_PATH,
+        incremental: bool = True
+) -> Tuple[Dict, pd.DataFrame, Dict[str, int]]:
+    # Load the dataset into a pandas DataFrame
+    df = pd.read_csv(file_path, dtype=object)
+    df = df[1:].reset_index(drop=True)  # remove the first description row
 
-    for alias in unit_alias:
-        df.loc[df.unit == alias.capitalize(), 'unit'] = 'Unit'
+    country = country_name(dataset_id)
+    units = unrecognized_units(df)
+    df = normalize_dataset(df)
 
-    df.to_csv(DATA_PATH.joinpath(f'{dataset_id.replace("wfp-food-prices-for-", "")}.csv'), index=False)
+    if incremental and dataset_path(country, data_path).exists():
+        # read the same way as a fresh download, so the columns keep their types after concatenation
+        previous = pd.read_csv(dataset_path(country, data_path), dtype=object)
+        previous = previous.astype({'price': float, 'usdprice': float})
 
+        # rows are merged by key rather than by date, markets reporting late and revised prices are not lost
+        df = df[~matching_rows(df, previous, [*ROW_KEY, 'price', 'usdprice'])].reset_index(drop=True)
+        revised = matching_rows(previous, df, ROW_KEY)
+        logger.info(f'Merging {len(df)} new rows into {country} dataset, replacing {revised.sum()} revised stored rows')
+        df = pd.concat([previous[~revised], df], ignore_index=True)
 
-def update_datasets():
-    if not DATA_PATH.exists():
-        os.makedirs(DATA_PATH)
+        # unrecognized units are stored as they are, so their rows can be counted in the merged dataset
+        unrecognized = {*read_units_report(data_path).get(country, {}), *units}
+        units = {
+            unit_str: int(count)
+            for unit_str, count in df.unit.value_counts().items()
+            if unit_str in unrecognized
+        }
+
+    write_dataset(df, country, data_path)
+    write_rollup(monthly_rollup(df), country, data_path)
 
-    for dataset_id in DATASET_SOURCES:
-        logger.info(f'Loading {dataset_id} dataset from HDX')
-        load_dataset(dataset_id)
+    return manifest_entry(df), coverage_table(df, country), units
+
+
+def read_units_report(data_path: Path = DATA_PATH) -> Dict[str, Dict[str, int]]:
+    report_path = meta_path(data_path).joinpath(UNITS_REPORT_FILE)
+    if not report_path.exists():
+        return {}
+
+    with open(report_path, 'r') as file:
+        return json.load(file)
+
+
+def write_units_report(report: Dict[str, Dict[str, int]], data_path: Path = DATA_PATH):
+    with atomic_path(meta_path(data_path).joinpath(UNITS_REPORT_FILE)) as path, open(path, 'w') as file:
+        json.dump(report, file, indent=2, sort_keys=True)
+
+
+def read_sources(data_path: Path = DATA_PATH) -> Dict[str, Dict]:
+    sources_path = meta_path(data_path).joinpath(SOURCES_FILE)
+    if not sources_path.exists():
+        return {}
+
+    with open(sources_path, 'r') as file:
+        return json.load(file)
+
+
+def write_sources(sources: Dict[str, Dict], data_path: Path = DATA_PATH):
+    with atomic_path(meta_path(data_path).joinpath(SOURCES_FILE)) as path, open(path, 'w') as file:
+        json.dump(sources, file, indent=2, sort_keys=True)
+
+
+def update_datasets(
+        dataset_ids: List[str] = None,
+        data_path: Path = DATA_PATH,
+        download_workers: int = 8,
+        process_workers: Optional[int] = None,
+        reader: Callable[[str], Dataset] = None,
+        incremental: bool = True,
+):
+    """Downloads the datasets with a thread pool and normalizes them with a process pool.
+
+    Sources are recorded with their HDX metadata and checksum once processed. Unchanged datasets are skipped,
+    which also lets an interrupted update continue where it stopped, and changed ones only get their new and revised rows merged.
+    """
+    dataset_ids = DATASET_SOURCES if dataset_ids is None else dataset_ids
+
+    # any callable returning an object with the Dataset interface can stand in for HDX, e.g. serving local files
+    if reader is None:
+        configure_hdx()
+        reader = Dataset.read_from_hdx
+
+    if not data_path.exists():
+        os.makedirs(data_path)
+
+    sources = read_sources(data_path) if incremental else {}
+    known_sources = {
+        dataset_id: sources.get(dataset_id)
+        for dataset_id in dataset_ids
+        if dataset_path(country_name(dataset_id), data_path).exists()
+    }
+
+    manifest = read_manifest(data_path)
+    coverage = {}
+    previous_coverage = read_coverage(data_path)
+    if previous_coverage is not None:
+        coverage.update((country, table) for country, table in previous_coverage.groupby('country'))
+
+    units_report = read_units_report(data_path)
+
+    failed = []
+    unchanged = 0
+
+    # spawn avoids forking the threads of the action server
+    process_context = multiprocessing.get_context('spawn')
+
+    with tempfile.TemporaryDirectory() as download_dir, \
+            ThreadPoolExecutor(max_workers=download_workers) as download_pool, \
+            ProcessPoolExecutor(max_workers=process_workers, mp_context=process_context) as process_pool:
+
+        downloads = {}
+        for dataset_id in dataset_ids:
+            future = download_pool.submit(download_dataset, dataset_id, download_dir, reader, known_sources.get(dataset_id))
+            downloads[future] = dataset_id
+
+        processing = {}
+        for future in as_completed(downloads):
+            dataset_id = downloads[future]
+            try:
+                source, file_path = future.result()
+            except Exception as e:
+                logger.error(f'Failed to download {dataset_id} dataset from HDX', exc_info=e)
+                failed.append(dataset_id)
+                continue
+
+            if file_path is None:
+                logger.info(f'{dataset_id} dataset did not change since the last update')
+                sources[dataset_id] = source
+                unchanged += 1
+                continue
+
+            logger.info(f'Downloaded {dataset_id} dataset from HDX')
+            future = process_pool.submit(process_dataset, dataset_id, file_path, data_path, incremental)
+            processing[future] = dataset_id, source
+
+        for future in as_completed(processing):
+            dataset_id, source = processing[future]
+            try:
+                country = country_name(dataset_id)
+                manifest[country], coverage[country], units_report[country] = future.result()
+            except Exception as e:
+                logger.error(f'Failed to normalize {dataset_id} dataset', exc_info=e)
+                failed.append(dataset_id)
+                continue
+
+            # recorded right away, a rerun after a crash will skip this dataset
+            sources[dataset_id] = source
+            write_sources(sources, data_path)
+
+    write_sources(sources, data_path)
+    logger.info(f'Updated {len(processing)} datasets, {unchanged} did not change')
+
+    countries = list_countries(data_path)
+
+    # datasets without a recorded summary are summarized from the stored files
+    missing = [country for country in countries if country not in manifest]
+    manifest.update(build_manifest(missing, data_path))
+    missing = [country for country in countries if country not in coverage]
+    coverage.update(zip(missing, build_coverage(missing, data_path)))
+    build_rollups([country for country in countries if rollup_version(country, data_path) is None], data_path)
+
+    write_manifest({country: manifest[country] for country in countries}, data_path)
+    write_coverage([coverage[country] for country in countries], data_path)
+    if len(processing) or consolidated_version(data_path) is None:
+        write_consolidated(countries, data_path)
+
+    units_report = {country: units for country, units in units_report.items() if len(units)}
+    write_units_report(units_report, data_path)
+    if len(units_report):
+        logger.warning(f'Unrecognized units are kept as they are in {len(units_report)} datasets, '
+                       f'see {UNITS_REPORT_FILE} for details')
+
+    if len(failed):
+        logger.warning(f'Failed to update {len(failed)} datasets: {", ".join(sorted(failed))}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Download and normalize WFP food price datasets from HDX')
+    parser.add_argument('--download-workers', type=int, default=8)
+    parser.add_argument('--process-workers', type=int, default=None)
+    parser.add_argument('--full', action='store_true', help='download and rewrite every dataset')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    update_datasets(
+        download_workers=args.download_workers,
+        process_workers=args.process_workers,
+        incremental=not args.full
+    )
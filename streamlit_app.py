@@ -2,53 +2,56 @@ import uuid
 
 import streamlit as st
 import requests
-from googletrans import Translator
 import pandas as pd
-import os
 
+from actions.charts import store_from_env
+from components.translators import load_backend
+from components.ui_translations import CATALOG_FILE, LANGUAGES, SOURCE_LANGUAGE, TRANSLATIONS_FILE, TranslationsFile, \
+    read_catalog
 
-# Initialize translator
-translator = Translator()
 
-# Path to the CSV file where translations will be cached
-TRANSLATIONS_FILE = 'translations_cache.csv'
+# Charts rendered by the actions server, referenced by their IDs in bot responses
+charts = store_from_env()
 
 
-# Function to load translations from CSV
-def load_translations():
-    if os.path.exists(TRANSLATIONS_FILE):
-        return pd.read_csv(TRANSLATIONS_FILE)
-    return pd.DataFrame(columns=['text', 'language', 'translation'])
+# shared by all sessions, created once per process
+@st.cache_resource
+def get_translator():
+    return load_backend('google')
 
 
-# Function to save translations to CSV
-def save_translations(df):
-    df.to_csv(TRANSLATIONS_FILE, index=False)
+@st.cache_resource
+def get_translations() -> TranslationsFile:
+    return TranslationsFile(TRANSLATIONS_FILE)
 
 
-# Load existing translations
-translations_cache = load_translations()
+# the interface and the responses of the bot translated in advance, see components/ui_translations.py
+@st.cache_resource
+def get_catalog():
+    return read_catalog(CATALOG_FILE)
 
 
 # Function to translate text and cache the result
-@st.cache_data(show_spinner=False)
 def translate_text(text, dest_language):
-    global translations_cache
+    # the interface and the bot responses are written in English
+    if dest_language == SOURCE_LANGUAGE:
+        return text
+
+    translation = get_catalog().get((text, dest_language))
+    if translation is not None:
+        return translation
+
+    translations = get_translations()
 
     # Check if the translation is already cached
-    cached_translation = translations_cache[
-        (translations_cache['text'] == text) & (translations_cache['language'] == dest_language)
-        ]
-    if not cached_translation.empty:
-        return cached_translation['translation'].values[0]
+    translation = translations.get(text, dest_language)
+    if translation is not None:
+        return translation
 
     with st.spinner():
         # Translate and cache the result
-        translation = translator.translate(text, dest=dest_language).text
-        new_translation = pd.DataFrame([[text, dest_language, translation]], columns=['text', 'language', 'translation'])
-
-        translations_cache = pd.concat([translations_cache, new_translation], ignore_index=True)
-        save_translations(translations_cache)
+        translation = get_translator().translate(text, 'auto', dest_language)
+        translations.add(text, dest_language, translation)
 
         return translation
 
@@ -70,17 +73,7 @@ if "sender_id" not in st.session_state:
 st.title('Price Watch')
 
 # Language selection dropdown
-languages = {
-    'English': 'en',
-    'Spanish': 'es',
-    'French': 'fr',
-    'German': 'de',
-    'Chinese': 'zh-cn',
-    'Japanese': 'ja',
-    'Russian': 'ru',
-    'Hindi': 'hi',
-    'Persian': 'fa'
-}
+languages = LANGUAGES
 
 # Initialize selected language in session state if not already set
 if 'selected_language' not in st.session_state:
@@ -125,8 +118,10 @@ with chat_container:
                     translated_message = translate_text(message_bot, languages[st.session_state.selected_language])
                     st.markdown(translated_message)
                 if image_paths:
-                    for path in image_paths:
-                        st.image(path)
+                    for chart_id in image_paths:
+                        path = charts.get(chart_id)
+                        if path is not None:
+                            st.image(str(path))
                 if table_data:
                     st.dataframe(pd.DataFrame(**table_data).astype(str), hide_index=True, use_container_width=True)
 
@@ -167,7 +162,7 @@ if prompt := st.chat_input(translate_text(
                         bot_responses.append(bot_response['text'])  # Adjust based on response structure
 
                     if 'image' in bot_response:
-                        images.extend(eval(bot_response['image']))
+                        images.extend(eval(bot_response['image']))  # chart IDs
 
                     if 'table' in bot_response.get('custom', {}):
                         table_data = bot_response['custom']['table']